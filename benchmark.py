@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Benchmarks of model build, solve and export
+#
+# Every case builds one PAP or BASE model for a horizon length and set of
+# components (battery, grid purchases), solves it with one backend and
+# exports the solution, timing each phase. A case runs in its own spawned
+# process, so the peak RSS it reports is its own. The records are written as
+# JSON lines to benchmarkOutput; with baselineFile, cases that got slower
+# than the same case of an earlier run are listed.
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from parameters import nHoursYear
+from instrumentation import peak_rss_mb
+
+#### SELECT CASES
+country = "SE"  # SE is the country with grid purchases
+price = "22"
+horizons = [168, 720, 2190, 8784, 2 * 8784]  # Hours, longer than a year repeats the weather year
+kinds = ["PAP", "BASE"]
+builders = ["hourly", "days"]  # build_pap / build_base, build_pap_days (PAP, whole years, with battery)
+representativeDays = 48  # Days of the "days" builder for a year, scaled with the horizon
+components = [{"battery": True, "gridBuy": True}, {"battery": False, "gridBuy": False}]  # PAP only
+backends = ["highs", "gurobi"]
+reduceModel = True
+startHour = 24 * 31  # Horizons shorter than a year start in February, after the zero demand week
+benchmarkOutput = "benchmark.jsonl"
+baselineFile = None  # e.g. "benchmark_old.jsonl" = list the cases that got slower than there
+slowdown = 1.25  # Tolerated time ratio to the baseline
+
+
+def benchmark_cases():
+    """Cases of the settings above as dicts."""
+    cases = []
+    for backend in backends:
+        for kind in kinds:
+            for builder in builders if kind == "PAP" else ["hourly"]:
+                for nHours in horizons:
+                    for parts in components if kind == "PAP" else [{}]:
+                        if builder == "days" and (nHours < nHoursYear or not parts["battery"]):
+                            continue  # Days of whole years, no fixed capacities
+                        case = dict(kind=kind, builder=builder, nHours=nHours, backend=backend, country=country, price=price)
+                        case.update(parts)
+                        cases.append(case)
+    return cases
+
+
+def run_case(case):
+    """Build, solve and export one case. Returns its record."""
+    from input_data import load_country
+    from parameters import pap_parameters, base_parameters
+    from model_builder import build_pap, build_pap_days, build_base
+    from model_reduction import reduce_model, no_reduction
+    from representative_days import cluster_days, full_year
+    from solver_backends import make_backend, expand_result
+    from solution_export import save_solution
+
+    record = dict(case)
+    n = case["nHours"]
+    start = startHour if n + startHour <= nHoursYear else 0
+    years = max(1, round(n / nHoursYear))
+
+    t = time.perf_counter()
+    if case["kind"] == "PAP":
+        params = pap_parameters(case["country"], case["price"])
+        params["GridBuy"] = case["gridBuy"]
+        series = [np.resize(np.asarray(values), start + n)[start:] for values in load_country(case["country"])]
+        capacities = None if case["battery"] else {"CapacityBattery": 0.0}
+        if case["builder"] == "days":
+            days = cluster_days(params, *series, representativeDays * years)
+            model = build_pap_days(params, *series, days, years=years)
+        else:
+            model = build_pap(params, *series, capacities=capacities, startHour=start, years=years)
+    else:
+        params = base_parameters(case["country"], case["price"])
+        model = build_base(params, n)
+    record["build"] = time.perf_counter() - t
+    record.update(numVars=model.numVars, numConstrs=model.numConstrs, nonZeros=int(model.A.nnz))
+
+    t = time.perf_counter()
+    solveModel, postsolve = reduce_model(model) if reduceModel else no_reduction(model)
+    record["reduce"] = time.perf_counter() - t
+    record.update(solveVars=solveModel.numVars, solveConstrs=solveModel.numConstrs, solveNonZeros=int(solveModel.A.nnz))
+
+    backend = make_backend(case["backend"])
+    try:
+        t = time.perf_counter()
+        backend.load(solveModel)
+        record["load"] = time.perf_counter() - t
+        t = time.perf_counter()
+        result = expand_result(backend.optimize(), model, postsolve)
+        record["solve"] = time.perf_counter() - t
+    finally:
+        backend.dispose()
+    record.update(status=result.status, objective=result.objective, solverTime=result.runtime,
+                  iterations=result.iterations)
+
+    if result.x is not None:
+        with tempfile.TemporaryDirectory() as directory:
+            t = time.perf_counter()
+            values = model.split(result.x)
+            if case["builder"] == "days":
+                values = full_year(values, days)
+            save_solution(os.path.join(directory, "solution.npz"), values, result.objective)
+            record["export"] = time.perf_counter() - t
+    record["peakRssMB"] = peak_rss_mb()  # None on Windows
+    return record
+
+
+def run_benchmarks(cases, output):
+    """Run every case in a fresh process and write the records to output.
+    A case that fails is recorded with its error."""
+    host = dict(host=platform.node(), python=platform.python_version(), cpus=os.cpu_count(), commit=_commit())
+    context = multiprocessing.get_context("spawn")
+    records = []
+    with open(output, "w") as f:
+        for case in cases:
+            with context.Pool(1) as pool:
+                try:
+                    record = pool.apply(run_case, (case,))
+                except Exception as error:  # e.g. a size-limited solver license
+                    record = dict(case, status="ERROR", error=str(error))
+            record.update(host)
+            records.append(record)
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            print(_summary(record))
+    return records
+
+
+def compare(records, baseline, tolerance=slowdown):
+    """Cases of records whose build, solve or export time is more than
+    tolerance times the time of the same case in the baseline records."""
+    def key(record):
+        return tuple(record.get(name) for name in ("kind", "builder", "nHours", "backend", "country", "price", "battery", "gridBuy"))
+
+    before = {key(record): record for record in baseline}
+    slower = []
+    for record in records:
+        old = before.get(key(record))
+        if old is None:
+            continue
+        for phase in ("build", "solve", "export"):
+            if phase in record and old.get(phase) and record[phase] > tolerance * old[phase]:
+                slower.append((key(record), phase, old[phase], record[phase]))
+    return slower
+
+
+def load_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _summary(record):
+    name = "%s %s %dh %s" % (record["kind"], record["builder"], record["nHours"], record["backend"])
+    if record["kind"] == "PAP":
+        name += " battery=%s gridBuy=%s" % (record["battery"], record["gridBuy"])
+    if record["status"] == "ERROR":
+        return "%s: %s" % (name, record["error"])
+    return "%s: %d x %d, build %.2f s, solve %.2f s, export %.3f s, peak %.0f MB, %s" % (
+        name, record["numConstrs"], record["numVars"], record["build"], record["solve"], record.get("export", float("nan")),
+        record["peakRssMB"] or float("nan"), record["status"])
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    records = run_benchmarks(benchmark_cases(), benchmarkOutput)
+    if baselineFile:
+        for case, phase, old, new in compare(records, load_records(baselineFile)):
+            print("Slower: %s %s %.2f s -> %.2f s" % (" ".join(str(part) for part in case), phase, old, new))
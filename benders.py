@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Two-stage stochastic PAP sizing with Benders (L-shaped) decomposition
+#
+# The capacities (CapacityElec, CapacityWind, CapacitySolar, CapacityBattery,
+# CapacityStorage) are chosen first; then every price and weather scenario
+# gets its own hourly dispatch. With Q_s(x) the optimal objective of the PAP
+# model of scenario s with the capacities fixed to x, the problem is
+#
+#   min sum_s p_s Q_s(x)
+#
+# Q_s is convex and piecewise linear in x, and its slope at x_k is the reduced
+# cost of the fixed capacity columns. Each iteration solves every scenario at
+# the master's capacities x_k and adds one cut per scenario,
+#
+#   theta_s >= Q_s(x_k) + g_s,k . (x - x_k)
+#
+# to the master problem min sum_s p_s theta_s over the capacities, whose
+# optimum is a lower bound of the stochastic optimum; the best evaluated x_k
+# gives the upper bound. Iterations stop when the gap is below gapTolerance.
+#
+# The scenarios are resampled years of monte_carlo.sample_series. Unmet
+# demand costs shortfallCost per kg in the subproblems (build_pap
+# demandShortfallCost), so every x has a finite Q_s and only optimality cuts
+# are needed. Capacities without a limit of their own are boxed at boxFactor
+# times the starting design; a design that converges onto a box widens it by
+# boxFactor and the iterations go on, so the final design is not cut off.
+#
+# The subproblems are split among worker processes, one chunk of scenarios
+# per worker and iteration. Between iterations only the bounds of the
+# capacity columns of a scenario change, so its last optimal basis is still
+# dual feasible: the parent keeps the basis of every scenario and the
+# workers restart dual simplex from it. The subproblems are not reduced
+# (model_reduction substitutes the fixed capacities out, and with them their
+# reduced costs) and keep the nonzero pattern of monte_carlo.fixed_pattern,
+# so a worker updates one loaded model in place from scenario to scenario.
+# Memory grows with the workers, not with the scenarios.
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from parameters import pap_parameters
+from model_builder import build_pap, capacityNames
+from model_reduction import reduce_model
+from solver_backends import make_backend, expand_result
+from sweep import input_series
+from monte_carlo import sample_series, fixed_pattern
+
+#### SELECT PROBLEM
+country = "FI"
+price = "22"
+nScenarios = 24  # Resampled years, equally likely
+seed = 2022
+shortfallCost = 100.0  # EUR per kg of hydrogen demand not met
+gapTolerance = 1e-4  # Relative gap between the bounds
+maxIterations = 100
+boxFactor = 10.0
+solverBackend = "gurobi"
+workers = 1
+bendersOutput = "benders_PAP_%s_%s.csv" % (country, price)
+
+capacityLimits = {"CapacityWind": "MaxCapacityWind", "CapacitySolar": "MaxCapacitySolar"}
+
+
+def master_problem(cuts, probabilities, upper):
+    """Solve the master problem over the cuts (scenario, objective, gradient,
+    capacities) with capacities between 0 and upper. Returns the capacities
+    and the lower bound."""
+    from scipy.optimize import linprog
+
+    nCap = len(upper)
+    nScen = len(probabilities)
+    c = np.concatenate([np.zeros(nCap), probabilities])
+    A = np.zeros((len(cuts), nCap + nScen))
+    b = np.zeros(len(cuts))
+    for i, (scenario, objective, gradient, point) in enumerate(cuts):
+        # gradient . x - theta_s <= gradient . x_k - Q_s(x_k)
+        A[i, :nCap] = gradient
+        A[i, nCap + scenario] = -1.0
+        b[i] = gradient @ point - objective
+    bounds = [(0.0, up) for up in upper] + [(None, None)] * nScen
+    res = linprog(c, A_ub=A, b_ub=b, bounds=bounds, method="highs")
+    if res.status != 0:
+        raise RuntimeError("Benders master problem: " + res.message)
+    return res.x[:nCap], res.fun
+
+
+def run_benders(country, price, output, nScenarios=nScenarios, seed=seed, shortfallCost=shortfallCost,
+                gapTolerance=gapTolerance, maxIterations=maxIterations, boxFactor=boxFactor, workers=1,
+                backend="gurobi", nHours=None, **options):
+    """Two-stage stochastic capacities of country and price over nScenarios
+    resampled years. Every iteration (bounds, gap, capacities) is written
+    to output. nHours shortens the horizon, options go to the solver
+    backends (threads defaults to cores // workers). Returns the best
+    capacities by name, their expected objective and the lower bound."""
+    options.setdefault("threads", max(1, (os.cpu_count() or 1) // max(1, workers)))
+    params = pap_parameters(country, price)
+    scenarios = list(range(nScenarios))
+    probabilities = np.full(nScenarios, 1.0 / nScenarios)
+    settings = (country, price, backend, options, seed, shortfallCost, nHours)
+
+    # Starting design: the deterministic optimum of the first scenario
+    _init_worker(*settings)
+    model = build_pap(params, *_context["series"][0])
+    solveModel, postsolve = reduce_model(model)
+    result = expand_result(_backend.solve(solveModel), model, postsolve)
+    if result.x is None:
+        _release_worker()
+        raise RuntimeError("Benders starting design: %s" % result.status)
+    values = model.split(result.x)
+    point = np.array([values[name] for name in capacityNames])
+    upper = np.array([params[capacityLimits[name]] if name in capacityLimits else boxFactor * max(value, 1.0)
+                      for name, value in zip(capacityNames, point)])
+    boxed = np.array([name not in capacityLimits for name in capacityNames])
+
+    chunks = [chunk for chunk in np.array_split(scenarios, max(1, workers)) if chunk.size]
+    starts = [None] * nScenarios
+    cuts = []
+    best = (np.inf, point)
+    lower = -np.inf
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=settings) if workers > 1 else None
+    try:
+        with open(output, mode='w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(["Iteration", "LowerBound", "UpperBound", "Gap", "Expected", "Shortfall"] + capacityNames)
+            for iteration in range(1, maxIterations + 1):
+                jobs = [(point, list(chunk), [starts[s] for s in chunk]) for chunk in chunks]
+                if pool is None:
+                    outcomes = [_solve_chunk(*job) for job in jobs]
+                else:
+                    outcomes = list(pool.map(_solve_chunk, *zip(*jobs)))
+
+                expected = 0.0
+                shortfall = 0.0
+                for chunk, chunkOutcomes in zip(chunks, outcomes):
+                    for s, (objective, gradient, start, unmet) in zip(chunk, chunkOutcomes):
+                        if gradient is None:
+                            raise RuntimeError("Benders scenario %d: %s" % (s, objective))
+                        cuts.append((s, objective, gradient, point))
+                        starts[s] = start
+                        expected += probabilities[s] * objective
+                        shortfall += probabilities[s] * unmet
+                if expected < best[0]:
+                    best = (expected, point)
+
+                point, lower = master_problem(cuts, probabilities, upper)
+                gap = (best[0] - lower) / max(abs(best[0]), 1e-9)
+                writer.writerow([iteration, lower, best[0], gap, expected, shortfall] + list(best[1]))
+                output_file.flush()
+                print("Iteration %d: lower %.8g, upper %.8g, gap %.2e" % (iteration, lower, best[0], gap))
+                if gap <= gapTolerance:
+                    # Converged within the boxes: done unless the design is on one
+                    atBox = boxed & (best[1] >= upper * (1 - 1e-9))
+                    if not atBox.any():
+                        break
+                    upper[atBox] *= boxFactor
+                    point, lower = master_problem(cuts, probabilities, upper)
+    finally:
+        _release_worker()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return dict(zip(capacityNames, best[1].tolist())), best[0], lower
+
+
+#### WORKER
+
+_backend = None
+_context = None
+
+
+def _start_worker(*settings):
+    # Pool processes exit through os._exit, so the backend is released by a
+    # multiprocessing finalizer rather than atexit (as in sweep.py)
+    from multiprocessing.util import Finalize
+
+    _init_worker(*settings)
+    Finalize(None, _release_worker, exitpriority=10)
+
+
+def _init_worker(country, price, backend, options, seed, shortfallCost, nHours):
+    global _backend, _context
+    _backend = make_backend(backend, **options)
+    series = input_series("PAP", country)
+    if nHours is not None:
+        series = tuple(np.asarray(values)[:nHours] for values in series)
+    _context = dict(params=pap_parameters(country, price), series=_ScenarioSeries(series, seed),
+                    shortfallCost=shortfallCost)
+
+
+def _release_worker():
+    global _backend
+    if _backend is not None:
+        _backend.dispose()
+        _backend = None
+
+
+class _ScenarioSeries:
+    """Series of scenario s, drawn when asked for."""
+
+    def __init__(self, series, seed):
+        self.series = series
+        self.seed = seed
+
+    def __getitem__(self, s):
+        return sample_series(self.series, s, self.seed)
+
+
+def _solve_chunk(point, chunk, starts):
+    """Q_s, its gradient, the optimal basis and the expected unmet demand
+    (kg) of every scenario of chunk at the capacities point."""
+    capacities = dict(zip(capacityNames, point))
+    outcomes = []
+    for s, start in zip(chunk, starts):
+        model = fixed_pattern(build_pap(_context["params"], *_context["series"][s], capacities=capacities,
+                                        demandShortfallCost=_context["shortfallCost"]))
+        if _backend.model is not None and _backend.model.same_structure(model):
+            _backend.update(model)
+            if start is not None:
+                _backend.warm_start(tuple(part.tolist() for part in start), "dual")
+        else:
+            _backend.load(model)
+        result = _backend.optimize()
+        if result.x is None or result.reducedCosts is None:
+            outcomes.append((result.status, None, None, None))
+            continue
+        columns = [model.varBlocks[name].start for name in capacityNames]
+        unmet = float(result.x[model.varBlocks["HydrogenShortfall"]].sum())
+        outcomes.append((result.objective, result.reducedCosts[columns], _compact(_backend.start()), unmet))
+    return outcomes
+
+
+def _compact(start):
+    # Bases travel between processes every iteration
+    if start is None:
+        return None
+    return tuple(np.asarray(part, dtype=np.int8) for part in start)
+
+
+if __name__ == "__main__":
+    capacities, objective, lower = run_benders(country, price, bendersOutput, workers=workers, backend=solverBackend)
+    print("Expected objective %.8g (lower bound %.8g)" % (objective, lower))
+    for name, value in capacities.items():
+        print("%s: %.6g" % (name, value))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Rule-based dispatch of fixed PAP designs without a solver
+#
+# simulate() costs many designs (capacities) against one set of hourly series
+# at once. The hours are one sequential pass, since the storage levels and
+# the ramps depend on the hour before, and every step updates all designs of
+# a chunk with a few NumPy operations. A year costs about the same for one
+# design as for a chunk of thousands, and only running totals are kept, so
+# memory grows with chunkSize and not with the hours.
+#
+# Every hour the policy
+#   1. runs the electrolyzer on wind and solar, up to the production that
+#      fills the hydrogen storage, within CapacityElec and the Pchange ramp
+#      (ramping down ahead of the maintenance break)
+#   2. covers what storage cannot give to demand, or the ramp-down limit,
+#      from the battery and then from grid purchases (GridBuy, SE)
+#   3. charges the battery from what is left and sells the rest at GridPrice
+# Demand that cannot be met is counted as Shortfall, and production that
+# falls faster than the ramp allows for want of electricity as RampShortfall
+# (kg per year). Storage and battery start at their initial shares. The
+# hourly flows follow the rows of build_pap, so
+# model_builder.pap_cost_totals() costs the dispatch the way the objective
+# of main.py does. The policy does not hold back storage or battery for the
+# end of horizon conditions, nor tie the battery level of hour 0 to the
+# last hour as build_pap does, so the dispatch need not be feasible for the
+# model and its objective is no bound on the optimum of the design; it is
+# an estimate for screening designs.
+
+import csv
+
+import numpy as np
+
+from input_data import load_country_years
+from parameters import nHoursYear, pap_parameters, demand_profile, hour_profile
+from model_builder import capacityNames, pap_cost_totals
+
+#### SELECT EVALUATION
+country = "FI"
+price = "22"
+weatherYear = 2019  # Series the designs are checked against
+designFile = "sensitivity_PAP.csv"  # Designs: the rows of country and price
+chunkSize = 4096  # Designs per pass
+simulationOutput = "simulation_PAP_%s_%s_%d.csv" % (country, price, weatherYear)
+
+
+def simulate(params, designs, windCF, solarCF, gridPrice, startHour=0, chunkSize=chunkSize):
+    """Dispatch every design over the series. designs maps the capacityNames
+    to one value per design (arrays, lists or a pandas DataFrame). Returns a
+    dict of arrays with one value per design: the pap_cost_terms(), their
+    sum Objective, LCOH (EUR/kg), HydrogenProduced, Shortfall and
+    RampShortfall (kg per year) and ElectricitySold (MWh per year)."""
+    capacities = dict(zip(capacityNames, np.broadcast_arrays(*[np.atleast_1d(np.asarray(designs[name], dtype=float))
+                                                               for name in capacityNames])))
+    nDesigns = capacities["CapacityElec"].size
+    n = len(windCF)
+    windCF = np.asarray(windCF, dtype=float)
+    solarCF = np.asarray(solarCF, dtype=float)
+    energyPrice = np.asarray(gridPrice[:n], dtype=float) * params["GridPriceScale"] + params["ElecTax"] + params["TransmisFee"]
+    demand = demand_profile(params, startHour + n)[startHour:]
+    years = n / nHoursYear
+
+    # Hours to the next maintenance hour, which ramp production down
+    maintenance = np.flatnonzero(hour_profile([params["MaintenanceHours"]], startHour + n)[startHour:])
+    following = np.searchsorted(maintenance, np.arange(n))
+    toMaintenance = np.full(n, n + 1.0)
+    ahead = following < maintenance.size
+    toMaintenance[ahead] = maintenance[following[ahead]] - np.flatnonzero(ahead)
+
+    results = {}
+    for first in range(0, nDesigns, chunkSize):
+        chunk = {name: values[first:first + chunkSize] for name, values in capacities.items()}
+        totals = _dispatch(params, chunk, windCF, solarCF, energyPrice, demand, toMaintenance)
+        terms = pap_cost_totals(params, chunk, totals, windCF.sum(), solarCF.sum(), years)
+        objective = sum(terms.values())
+        produced = totals["HydrogenProd"]
+        lcoh = np.zeros(produced.shape)
+        np.divide(objective, produced, out=lcoh, where=produced > 0)
+        terms.update(Objective=objective, LCOH=lcoh, HydrogenProduced=produced / years,
+                     Shortfall=totals["Shortfall"] / years, RampShortfall=totals["RampShortfall"] / years,
+                     ElectricitySold=totals["Sold"] / years)
+        for name, values in terms.items():
+            results.setdefault(name, []).append(np.broadcast_to(values, produced.shape))
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def _dispatch(params, capacities, windCF, solarCF, energyPrice, demand, toMaintenance):
+    """One pass of the policy over the hours for a chunk of designs. Returns
+    the totals of pap_cost_totals() and Shortfall, RampShortfall and Sold
+    (MWh)."""
+    EfficiencyElec = params["EfficiencyElec"]
+    ChargeEfficiency = params["ChargeEfficiency"]
+    gridBuy = params["GridBuy"]
+    maxProd = EfficiencyElec * capacities["CapacityElec"]
+    maxChange = params["Pchange"] * EfficiencyElec * capacities["CapacityElec"]
+    storageMax = capacities["CapacityStorage"]
+    batteryMax = params["DepthOfDischarge"] * capacities["CapacityBattery"]
+    batteryChange = params["ChargePowerPerc"] * ChargeEfficiency * capacities["CapacityBattery"]
+    capWind = capacities["CapacityWind"]
+    capSolar = capacities["CapacitySolar"]
+    kgPerBattery = EfficiencyElec * ChargeEfficiency  # kg of hydrogen per MWh of battery level
+
+    # Hour 0 sets the initial levels (build_pap), its production is sold
+    stored = params["StorageInitShare"] * storageMax
+    battery = 0.2 * capacities["CapacityBattery"]
+    prod = np.zeros(maxProd.shape)
+    power0 = capWind * windCF[0] + capSolar * solarCF[0]
+    totals = dict(HydrogenProd=np.zeros(maxProd.shape), ElectricitySold=power0 * energyPrice[0],
+                  ElectricityBought=np.zeros(maxProd.shape), Shortfall=np.zeros(maxProd.shape),
+                  RampShortfall=np.zeros(maxProd.shape), Sold=power0.copy())
+
+    for h in range(1, len(demand)):
+        power = capWind * windCF[h] + capSolar * solarCF[h]
+        d = demand[h]
+        upper = np.minimum(np.minimum(maxProd, prod + maxChange), toMaintenance[h] * maxChange)
+        room = d + storageMax - stored  # production that fills the storage
+        renewable = np.minimum(np.minimum(EfficiencyElec * power, upper), room)
+        required = np.minimum(np.minimum(np.maximum(d - stored, prod - maxChange), upper), room)
+        missing = np.maximum(required - renewable, 0.0)
+        discharge = np.minimum(np.minimum(missing / kgPerBattery, battery), batteryChange)
+        lowest = prod - maxChange
+        prod = renewable + kgPerBattery * discharge
+        if gridBuy:
+            bought = (missing - kgPerBattery * discharge) / EfficiencyElec
+            prod = prod + EfficiencyElec * bought
+            totals["ElectricityBought"] += energyPrice[h] * bought
+        surplus = power - renewable / EfficiencyElec
+        charge = np.minimum(np.minimum(surplus / ChargeEfficiency, batteryMax - battery), batteryChange)
+        sold = surplus - ChargeEfficiency * charge
+        shortfall = np.maximum(d - stored - prod, 0.0)
+        totals["RampShortfall"] += np.maximum(np.minimum(lowest, room) - prod, 0.0)
+        stored = stored + prod + shortfall - d
+        battery = battery - discharge + charge
+        totals["HydrogenProd"] += prod
+        totals["ElectricitySold"] += energyPrice[h] * sold
+        totals["Shortfall"] += shortfall
+        totals["Sold"] += sold
+    return totals
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    import time
+
+    params = pap_parameters(country, price)
+    # On the nHoursYear calendar of the models, as the designs were sized
+    windRaw, solarRaw, priceRaw = load_country_years(country, [weatherYear])
+    designs = pd.read_csv(designFile)
+    designs = designs[(designs["Country"] == country) & (designs["PAP Year"].astype(str) == price)].reset_index(drop=True)
+    t = time.perf_counter()
+    results = simulate(params, designs, windRaw, solarRaw, priceRaw)
+    elapsed = time.perf_counter() - t
+    columns = ["Scenario"] + capacityNames + ["Objective"] + [name for name in results if name != "Objective"]
+    with open(simulationOutput, mode='w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(columns)
+        for i, scenario in enumerate(designs["Scenario"]):
+            writer.writerow([scenario] + [designs[name][i] for name in capacityNames] + [results[name][i] for name in columns[6:]])
+    print("%d designs in %.3f s, written to %s" % (len(designs), elapsed, simulationOutput))
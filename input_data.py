@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Hourly input series with a binary cache
+#
+# Parsing wind_2020.xlsx, solar_2020.xlsx and hourly_prices.xlsx with
+# pd.read_excel takes seconds, and the scripts only need one column of each.
+# The first load converts every numeric column of a workbook into its own
+# .npy file under .cache/<workbook>/; later loads memory-map the column in
+# milliseconds. A cache is rebuilt when its workbook's size and SHA-256 no
+# longer match (the hash is only computed when the mtime changed), and the
+# rebuild removes the files of columns the workbook no longer has.
+#
+# load_years() stacks the series of several weather years into one float32
+# array of shape (year, hour, country), stored once under .cache/stacks/ and
+# memory-mapped, so multi-year runs never hold the workbooks in pandas. Years
+# of 8760 hours get 29 February as a copy of 28 February, which keeps every
+# year on the 8784-hour calendar of the demand and maintenance profiles.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from parameters import nHoursYear
+
+dataDir = os.path.dirname(os.path.abspath(__file__))
+cacheDir = os.path.join(dataDir, ".cache")
+
+countries = ["FI", "SE", "DE"]
+kinds = ["wind", "solar", "price"]
+
+# Workbook and column of every series, by weather year and country
+seriesColumns = {
+    2020: {
+        "wind": {"FI": ("wind_2020.xlsx", 1), "SE": ("wind_2020.xlsx", 2), "DE": ("wind_2020.xlsx", 3)},
+        "solar": {"FI": ("solar_2020.xlsx", 1), "SE": ("solar_2020.xlsx", 2), "DE": ("solar_2020.xlsx", 3)},
+        "price": {"FI": ("hourly_prices.xlsx", 7), "SE": ("hourly_prices.xlsx", 3), "DE": ("hourly_prices.xlsx", 27)},
+    },
+    2019: {
+        "wind": {"FI": ("wind_FI.xlsx", 4), "DE": ("tuulidata_Cuxhaven_150m_2019.xlsx", 4)},  # cap_factor
+        "solar": {"FI": ("solar_FI.xlsx", 6)},  # capacity_factor
+        "price": {"FI": ("electricity_price_FI.xlsx", 4)},  # imbalance price
+    },
+}
+defaultYear = 2020
+
+# Header row of workbooks that start with notes
+headerRows = {"tuulidata_Cuxhaven_150m_2019.xlsx": 3}
+
+
+def load_country(country, year=defaultYear):
+    """Wind and solar capacity factors and grid prices of a country as
+    read-only float arrays: (windRaw, solarRaw, priceRaw)."""
+    return tuple(load_series(kind, country, year) for kind in kinds)
+
+
+def load_series(kind, country, year=defaultYear):
+    """One hourly series ("wind", "solar" or "price") of a country."""
+    columns = seriesColumns[year][kind]
+    if country not in columns:
+        raise ValueError("No %s data for %s in %d" % (kind, country, year))
+    return load_column(*columns[country])
+
+
+def load_country_years(country, years):
+    """(windRaw, solarRaw, priceRaw) of a country with the weather years
+    back to back, nHoursYear hours per year."""
+    c = countries.index(country)
+    series = []
+    for kind in kinds:
+        values = np.asarray(load_years(kind, years)[:, :, c], dtype=float).ravel()
+        if np.isnan(values).any():
+            raise ValueError("No %s data for %s in every year of %s" % (kind, country, list(years)))
+        series.append(values)
+    return tuple(series)
+
+
+def load_years(kind, years):
+    """Series of kind for the weather years as a read-only memory-mapped
+    float32 array of shape (len(years), nHoursYear, len(countries)), NaN
+    where a year has no data for a country."""
+    sources = {}
+    for year in years:
+        for country, (workbook, column) in seriesColumns[year][kind].items():
+            with open(os.path.join(_cache(os.path.join(dataDir, workbook)), "meta.json")) as f:
+                sources["%d %s" % (year, country)] = [workbook, column, json.load(f)["sha256"]]
+    key = hashlib.sha256(json.dumps([kind, list(years), countries, sources], sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cacheDir, "stacks", "%s-%s.npy" % (kind, key[:16]))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        stack = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32,
+                                          shape=(len(years), nHoursYear, len(countries)))
+        stack[:] = np.nan
+        for y, year in enumerate(years):
+            for c, country in enumerate(countries):
+                if country in seriesColumns[year][kind]:
+                    stack[y, :, c] = _leap_year(load_series(kind, country, year))
+        stack.flush()
+        del stack
+        os.replace(tmp, path)
+    return np.load(path, mmap_mode="r")
+
+
+def _leap_year(values):
+    """Hours of a year on the nHoursYear calendar: 8760-hour years repeat
+    28 February as 29 February."""
+    values = np.asarray(values, dtype=float)
+    if values.size == nHoursYear - 24:
+        feb29 = 59 * 24
+        values = np.concatenate([values[:feb29], values[feb29 - 24:feb29], values[feb29:]])
+    if values.size != nHoursYear:
+        raise ValueError("Expected %d or %d hours, got %d" % (nHoursYear - 24, nHoursYear, values.size))
+    return values
+
+
+def load_column(workbook, column):
+    """Column number column of workbook (like df.iloc[:, column]) as a
+    read-only memory-mapped float array."""
+    path = os.path.join(dataDir, workbook)
+    directory = _cache(path)
+    columnFile = os.path.join(directory, "%d.npy" % column)
+    if not os.path.exists(columnFile):
+        raise ValueError("Column %d of %s is not numeric" % (column, workbook))
+    return np.load(columnFile, mmap_mode="r")
+
+
+def _cache(path):
+    """Cache directory of a workbook, rebuilt if the workbook changed."""
+    directory = os.path.join(cacheDir, os.path.splitext(os.path.basename(path))[0])
+    metaFile = os.path.join(directory, "meta.json")
+    stat = os.stat(path)
+    meta = None
+    if os.path.exists(metaFile):
+        with open(metaFile) as f:
+            meta = json.load(f)
+        if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime_ns:
+            return directory
+        if meta["size"] == stat.st_size and meta["sha256"] == _sha256(path):
+            # Touched but not changed
+            meta["mtime"] = stat.st_mtime_ns
+            _write_json(metaFile, meta)
+            return directory
+
+    import pandas as pd
+
+    os.makedirs(directory, exist_ok=True)
+    df = pd.read_excel(path, header=headerRows.get(os.path.basename(path), 0))
+    columns = {}
+    for i, name in enumerate(df.columns):
+        try:
+            values = df.iloc[:, i].astype(float).to_numpy()
+        except (TypeError, ValueError):
+            continue  # dates and text
+        _write_npy(os.path.join(directory, "%d.npy" % i), values)
+        columns[i] = str(name)
+    for name in os.listdir(directory):
+        # Columns of an earlier build that the workbook no longer has
+        if name.endswith(".npy") and name[:-4].isdigit() and int(name[:-4]) not in columns:
+            os.remove(os.path.join(directory, name))
+    meta = {"source": os.path.basename(path), "size": stat.st_size, "mtime": stat.st_mtime_ns,
+            "sha256": _sha256(path), "columns": columns}
+    _write_json(metaFile, meta)
+    return directory
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Files are written next to their final name and then renamed, so parallel
+# runs never see half written cache files
+
+def _write_npy(path, values):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp, path)
+
+
+def _write_json(path, data):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Phase timings and solver progress of runs
+#
+# A RunLog collects what a slow run spends its time on: the wall and CPU time
+# of every phase (reading the inputs, building, reducing, solving, key
+# figures, export), the peak resident memory after each phase, the size of
+# the built and the reduced model and the solver's own figures, among them
+# the progress samples of GurobiBackend(progress=True): iteration count,
+# primal objective and dual bound over the solve time, by solver phase
+# (presolve, barrier, crossover, simplex). write() appends the whole run as
+# one JSON line, so the records of hundreds of runs can be read into one
+# table with load_runs(). A RunLog without a path only collects, e.g. in the
+# sweep workers that hand their records to the parent process.
+
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb(children=False):
+    """Peak resident memory of this process (or of its finished child
+    processes) in MB, None where the resource module is missing."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss / 1024  # kB on Linux
+
+
+def model_stats(model):
+    """Rows, columns and nonzeros of a LinearModel."""
+    return dict(rows=model.numConstrs, cols=model.numVars, nonzeros=int(model.A.nnz), hours=model.nHours)
+
+
+class RunLog:
+    """Record of one run. info (country, price, settings, ...) is stored as
+    it is; phases, models and solves are added while the run goes on."""
+
+    def __init__(self, path, script, **info):
+        self.path = path
+        self.start = time.time()
+        self.clock = time.perf_counter()
+        self.data = dict(script=script, started=time.strftime("%Y-%m-%d %H:%M:%S"), host=socket.gethostname(),
+                         pid=os.getpid(), **info)
+        self.phases = []
+        self.models = {}
+        self.solves = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as phase name. A phase that fails is
+        recorded with its error."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        entry = dict(name=name, start=round(wall - self.clock, 4))
+        try:
+            yield entry
+        except BaseException as error:
+            entry["error"] = repr(error)
+            raise
+        finally:
+            entry.update(wall=time.perf_counter() - wall, cpu=time.process_time() - cpu, peakRssMB=peak_rss_mb())
+            self.phases.append(entry)
+
+    def model(self, name, model):
+        """Size of a LinearModel, e.g. "built" and "solved" (after reduction)."""
+        self.models[name] = model_stats(model)
+
+    def solver(self, result, **info):
+        """Figures of a SolverResult. info tells solves apart, e.g. scenario."""
+        entry = dict(info, backend=result.backend, modelClass=result.modelClass, status=result.status,
+                     objective=result.objective, runtime=result.runtime, iterations=result.iterations)
+        entry.update(result.stats)
+        if result.progress:
+            entry["progress"] = result.progress
+        self.solves.append(entry)
+
+    def set(self, **info):
+        self.data.update(info)
+
+    def record(self):
+        """The run as a JSON-serialisable dict."""
+        total = {}
+        for entry in self.phases:
+            total[entry["name"]] = total.get(entry["name"], 0.0) + entry["wall"]
+        return dict(self.data, wall=time.perf_counter() - self.clock, peakRssMB=peak_rss_mb(),
+                    phaseTotals=total, phases=self.phases, models=self.models, solves=self.solves)
+
+    def write(self):
+        """Append the record to the log file, if the log has one."""
+        if self.path:
+            write_record(self.path, self.record())
+
+
+def write_record(path, record):
+    """Append one record as a JSON line. Each record is a single write, so
+    processes can share the file."""
+    line = json.dumps(record, default=_plain) + "\n"
+    with open(path, "a") as f:
+        f.write(line)
+
+
+def load_runs(path):
+    """Records of a log file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def phase_table(records):
+    """Total wall time of every phase by run, as a pandas DataFrame with one
+    row per run and one column per phase."""
+    import pandas as pd
+
+    return pd.DataFrame([dict(script=r.get("script"), started=r.get("started"), wall=r.get("wall"),
+                              peakRssMB=r.get("peakRssMB"), **r.get("phaseTotals", {})) for r in records])
+
+
+def _plain(value):
+    # numpy scalars and arrays in info
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Key figures of a solved PAP or BASE model
+#
+# run_kpis() computes the levelised cost of hydrogen, the electrolyzer
+# utilisation, the electricity sold and its market revenue (PAP), the
+# curtailed electricity (BASE) and the storage cycling from the solution
+# blocks of a run (model.split() output). Every figure is a reduction over
+# the last axis, so batch_kpis() gets the figures of many runs at once from
+# their stacked hourly arrays. Annual figures are per average year of the
+# horizon.
+
+import numpy as np
+
+from parameters import nHoursYear
+
+kpiColumns = {
+    "PAP": ["LCOH", "HydrogenProduced", "ElectrolyzerUtilisation", "FullLoadHours", "ElectricitySold", "SalesRevenue",
+            "StorageCycles", "BatteryCycles"],
+    "BASE": ["LCOH", "HydrogenProduced", "ElectrolyzerUtilisation", "FullLoadHours", "Curtailment", "StorageCycles"],
+}
+
+
+def run_kpis(kind, params, values, objective, gridPrice=None):
+    """Key figures of a PAP or BASE run by kpiColumns name.
+
+    LCOH is the objective per kg of hydrogen (EUR/kg), HydrogenProduced kg,
+    ElectricitySold and Curtailment MWh and SalesRevenue EUR at the grid
+    price, all per year. StorageCycles and BatteryCycles are full
+    equivalent cycles per year. gridPrice is needed for PAP runs, which have
+    no Curtailment: the balance of build_pap sells every MWh the
+    electrolyzer and battery do not take.
+
+    params, the capacities in values and objective may also be sequences and
+    the hourly arrays 2-D (run, hour), see batch_kpis().
+    """
+    H = np.asarray(values["HydrogenProd"], dtype=float)
+    n = H.shape[-1]
+    years = n / nHoursYear
+    EfficiencyElec = _param(params, "EfficiencyElec")
+
+    produced = H.sum(axis=-1)
+    used = produced / EfficiencyElec  # MWh to the electrolyzer
+    kpis = {
+        "LCOH": _ratio(np.asarray(objective, dtype=float) * years, produced),
+        "HydrogenProduced": produced / years,
+        "ElectrolyzerUtilisation": _ratio(produced, EfficiencyElec * _capacity(values, "CapacityElec") * n),
+    }
+    kpis["FullLoadHours"] = kpis["ElectrolyzerUtilisation"] * nHoursYear
+
+    if kind == "PAP":
+        sold = np.asarray(values["ElectricitySold"], dtype=float)
+        price = _param(params, "GridPriceScale")[..., None] * np.asarray(gridPrice[:n], dtype=float)
+        kpis["ElectricitySold"] = sold.sum(axis=-1) / years
+        kpis["SalesRevenue"] = (price * sold).sum(axis=-1) / years
+    else:
+        # Electricity that is produced but not used
+        available = np.asarray(values["ElectrisityProd"], dtype=float).sum(axis=-1)
+        kpis["Curtailment"] = np.maximum(available - used, 0.0) / years
+
+    kpis["StorageCycles"] = _cycles(values, "HydrogenStored", "CapacityStorage", years)
+    if kind == "PAP":
+        kpis["BatteryCycles"] = _cycles(values, "ElectricityStored", "CapacityBattery", years)
+    return {name: float(kpis[name]) if np.ndim(kpis[name]) == 0 else kpis[name] for name in kpiColumns[kind]}
+
+
+def batch_kpis(kind, params, values, objectives, gridPrice=None):
+    """run_kpis() of many runs of the same horizon in one go: params,
+    values and objectives are lists with one entry per run. Returns a dict
+    of arrays with one value per run."""
+    stacked = {name: np.stack([np.asarray(v[name], dtype=float) for v in values])
+               for name in values[0] if name in _used}
+    return run_kpis(kind, params, stacked, np.asarray(objectives, dtype=float), gridPrice)
+
+
+_used = {"HydrogenProd", "ElectrisityProd", "ElectricitySold", "ElectricityBought", "HydrogenStored", "ElectricityStored",
+         "CapacityElec", "CapacityStorage", "CapacityBattery"}
+
+
+def _param(params, key):
+    if isinstance(params, dict):
+        return np.asarray(float(params[key]))
+    return np.array([float(p[key]) for p in params])
+
+
+def _capacity(values, name):
+    return np.asarray(values.get(name, 0.0), dtype=float)
+
+
+def _cycles(values, level, capacity, years):
+    """Charged amount per capacity and year: the sum of the level rises."""
+    rises = np.maximum(np.diff(np.asarray(values[level], dtype=float), axis=-1), 0.0).sum(axis=-1)
+    return _ratio(rises, _capacity(values, capacity) * years)
+
+
+def _ratio(a, b):
+    """a / b, zero where b is zero."""
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    out = np.zeros(a.shape)
+    np.divide(a, b, out=out, where=b != 0)
+    return out if out.ndim else float(out)
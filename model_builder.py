@@ -0,0 +1,615 @@
+# -*- coding: utf-8 -*-
+# Matrix-form model builder for the PAP and BASE hydrogen models
+#
+# The model scripts used to add every hourly constraint with a Python
+# generator over range(0, nHours), i.e. ~100k expression objects per model.
+# Here each constraint family is one block of a sparse matrix: hourly
+# couplings to a capacity are coefficient columns and the storage and ramp
+# dynamics are shifted identity matrices. The resulting LinearModel is solver
+# neutral; to_gurobi() emits every block with a single A @ x call.
+
+import numpy as np
+import scipy.sparse as sp
+
+from parameters import nHoursYear, demand_profile, hour_profile
+
+# Scalar decision variables, i.e. the design of the plant
+capacityNames = ["CapacityElec", "CapacityWind", "CapacitySolar", "CapacityBattery", "CapacityStorage"]
+
+
+class LinearModel:
+    """Sparse linear program
+
+        min  c @ x + objConstant
+        s.t. A @ x  (sense)  rhs,   lb <= x <= ub
+
+    Columns and rows are grouped into named blocks: varBlocks and rowBlocks
+    map a block name (HydrogenProd, DemandConstr, ...) to its slice of x or
+    of the rows. Blocks listed in scalarVars are single variables such as
+    CapacityElec.
+    """
+
+    def __init__(self, name, c, objConstant, lb, ub, A, sense, rhs, varBlocks, rowBlocks, scalarVars, nHours, params=None):
+        self.name = name
+        self.c = c
+        self.objConstant = objConstant
+        self.lb = lb
+        self.ub = ub
+        self.A = A
+        self.sense = sense
+        self.rhs = rhs
+        self.varBlocks = varBlocks
+        self.rowBlocks = rowBlocks
+        self.scalarVars = scalarVars
+        self.nHours = nHours
+        self.params = params
+
+    @property
+    def numVars(self):
+        return self.A.shape[1]
+
+    @property
+    def numConstrs(self):
+        return self.A.shape[0]
+
+    def var_names(self):
+        """Variable names in column order, as Gurobi names MVar entries."""
+        names = []
+        for block, cols in self.varBlocks.items():
+            if block in self.scalarVars:
+                names.append(block)
+            else:
+                names.extend("%s[%d]" % (block, i) for i in range(cols.stop - cols.start))
+        return names
+
+    def split(self, x):
+        """Split a solution vector into a dict of named arrays (floats for
+        scalar variables)."""
+        values = {}
+        for block, cols in self.varBlocks.items():
+            values[block] = float(x[cols.start]) if block in self.scalarVars else x[cols]
+        return values
+
+    def same_structure(self, other):
+        """Whether other has the same blocks, row senses and nonzero pattern,
+        i.e. differs from this model only in coefficient values, bounds and
+        right-hand sides."""
+        if self.A.shape != other.A.shape or self.varBlocks != other.varBlocks or self.rowBlocks != other.rowBlocks:
+            return False
+        if not np.array_equal(self.sense, other.sense):
+            return False
+        A, B = self.A.tocsr(), other.A.tocsr()
+        A.sort_indices()
+        B.sort_indices()
+        return np.array_equal(A.indptr, B.indptr) and np.array_equal(A.indices, B.indices)
+
+
+class _Assembler:
+    """Collects variable and constraint blocks as COO triplets."""
+
+    def __init__(self, name, nHours, params):
+        self.name = name
+        self.nHours = nHours
+        self.params = params
+        self.varBlocks = {}
+        self.scalarVars = []
+        self.rowBlocks = {}
+        self.nCols = 0
+        self.nRows = 0
+        self.lb = []
+        self.ub = []
+        self.obj = {}
+        self.objConstant = 0.0
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.sense = []
+        self.rhs = []
+
+    def add_var(self, name, size=None, lb=0.0, ub=np.inf):
+        """Add a block of size variables, or one scalar variable if size is None."""
+        n = 1 if size is None else size
+        self.varBlocks[name] = slice(self.nCols, self.nCols + n)
+        if size is None:
+            self.scalarVars.append(name)
+        self.nCols += n
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), n))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), n))
+        self.obj[name] = np.zeros(n)
+
+    def add_obj(self, name, coeffs):
+        """Add coeffs (scalar or per-variable array) to the objective of block name."""
+        self.obj[name] += coeffs
+
+    def add_rows(self, name, terms, sense, rhs):
+        """Add the constraint block sum(M @ var for var, M in terms) sense rhs.
+
+        M is a sparse matrix with one row per constraint. For scalar variables
+        M may also be a 1-d array of coefficients, one per constraint.
+        """
+        nNew = max([np.size(rhs)] + [coeffs.shape[0] if sp.issparse(coeffs) else np.size(coeffs) for _, coeffs in terms])
+        for var, coeffs in terms:
+            cols = self.varBlocks[var]
+            if var in self.scalarVars:
+                coeffs = np.broadcast_to(np.asarray(coeffs, dtype=float), nNew)
+                nz = np.flatnonzero(coeffs)
+                self.rows.append(self.nRows + nz)
+                self.cols.append(np.full(nz.size, cols.start))
+                self.vals.append(coeffs[nz])
+            else:
+                coo = sp.coo_matrix(coeffs)
+                self.rows.append(self.nRows + coo.row)
+                self.cols.append(cols.start + coo.col)
+                self.vals.append(coo.data)
+        self.rowBlocks[name] = slice(self.nRows, self.nRows + nNew)
+        self.nRows += nNew
+        self.sense.append(np.full(nNew, sense))
+        self.rhs.append(np.broadcast_to(np.asarray(rhs, dtype=float), nNew))
+
+    def finish(self):
+        A = sp.csr_matrix((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                          shape=(self.nRows, self.nCols))
+        return LinearModel(self.name, np.concatenate(list(self.obj.values())), self.objConstant,
+                           np.concatenate(self.lb), np.concatenate(self.ub), A,
+                           np.concatenate(self.sense), np.concatenate(self.rhs),
+                           self.varBlocks, self.rowBlocks, set(self.scalarVars), self.nHours, self.params)
+
+
+#### BLOCK HELPERS
+
+def identity(n):
+    """x[h] for h in range(0, n)"""
+    return sp.identity(n, format="csr")
+
+
+def current(n):
+    """x[h] for h in range(1, n)"""
+    return sp.eye(n - 1, n, k=1, format="csr")
+
+
+def previous(n):
+    """x[h-1] for h in range(1, n)"""
+    return sp.eye(n - 1, n, k=0, format="csr")
+
+
+def previous_cyclic(n):
+    """x[h-1] for h in range(0, n), where x[-1] is the last hour like in
+    Python indexing"""
+    return sp.csr_matrix((np.ones(n), (np.arange(n), np.arange(-1, n - 1) % n)), shape=(n, n))
+
+
+def previous_or_zero(n):
+    """x[h-1] for h in range(0, n), where x[-1] is zero"""
+    return sp.eye(n, n, k=-1, format="csr")
+
+
+def select(n, hours):
+    """x[h] for h in hours"""
+    hours = np.asarray(hours)
+    return sp.csr_matrix((np.ones(hours.size), (np.arange(hours.size), hours)), shape=(hours.size, n))
+
+
+#### FORMULATIONS
+
+def build_pap(params, windCF, solarCF, gridPrice, nHours=None, capacities=None, initialState=None, startHour=0,
+              endCondition=True, endStorage=None, shortfallCost=1000.0, years=1, demandShortfallCost=None):
+    """Pay-as-produced model: wind and solar bought by produced MWh, battery,
+    hydrogen storage and grid sales (and purchases in SE).
+
+    With years > 1 the series hold that many weather years back to back
+    (input_data.load_country_years) and the hourly costs are averaged over
+    them, so the objective stays the cost of an average year.
+
+    The options build one window of a longer operation: capacities fixes
+    capacity variables ({"CapacityElec": ..., ...}), startHour is the hour of
+    the year of the first hour (demand and maintenance follow the calendar),
+    initialState gives HydrogenStored, ElectricityStored and HydrogenProd of
+    the hour before the window instead of the initial conditions,
+    endCondition=False drops the end of horizon storage conditions and
+    endStorage is a target hydrogen storage level (kg) for the last hour,
+    where every kg short of it costs shortfallCost.
+
+    demandShortfallCost lets hydrogen demand go unmet at that cost per kg
+    (HydrogenShortfall), so that the model stays feasible for any fixed
+    capacities, e.g. as a scenario subproblem of benders.py.
+    """
+    if nHours is None:
+        nHours = len(windCF)
+    n = nHours
+    CapFactorWind = np.asarray(windCF[:n], dtype=float)    # Tuntikohtainen kapasiteettikerroin
+    CapFactorSolar = np.asarray(solarCF[:n], dtype=float)
+    GridPrice = np.asarray(gridPrice[:n], dtype=float) * params["GridPriceScale"]
+    Demand = demand_profile(params, startHour + n)[startHour:]
+    capacities = capacities or {}
+
+    EfficiencyElec = params["EfficiencyElec"]
+    ChargeEfficiency = params["ChargeEfficiency"]
+    ElecTax = params["ElecTax"]
+    TransmisFee = params["TransmisFee"]
+    mb = _Assembler("PAP", n, params)
+
+    def add_capacity(name):
+        if name in capacities:
+            mb.add_var(name, lb=capacities[name], ub=capacities[name])
+        else:
+            mb.add_var(name)
+
+    #### ADD DECISION VARIABLES
+    add_capacity("CapacityElec")
+    mb.add_var("HydrogenProd", n)       # Hourly hydrogen production (kg)
+    add_capacity("CapacityWind")        # Ostettu tuulen tuotantokapasiteetti (MW) PAP
+    mb.add_var("WindProd", n)           # multiply helper variable
+    add_capacity("CapacitySolar")       # Ostettu aurikovoima tuotantokapasiteetti (MW) PAP
+    mb.add_var("SolarProd", n)          # multiply helper variable
+    add_capacity("CapacityBattery")
+    mb.add_var("ElectricityStored", n)  # Hourly battery level
+    add_capacity("CapacityStorage")     # Hydrogen storage capacity (kg)
+    mb.add_var("HydrogenStored", n)     # Hourly storage level of hydrogen(kg)
+    mb.add_var("ElectricitySold", n)    # Hourly sales of electricity
+    if params["GridBuy"]:
+        mb.add_var("ElectricityBought", n)  # Hourly electricity purchases in Sweden
+    if endStorage is not None:
+        mb.add_var("StorageShortfall")  # Hydrogen short of the end target (kg)
+    nDemand = n - 1 if initialState is None else n
+    if demandShortfallCost is not None:
+        mb.add_var("HydrogenShortfall", nDemand)  # Hourly demand not met (kg)
+    mb.add_var("ElectrisityProd", n)    # CapasityWind * CapFactorWind[h] + CapasitySolar * CapFactorSolar[h]
+
+    #### ADD CONSTRAINTS
+
+    # Constrain definitions for supporting variables
+    mb.add_rows("WindProdConstr", [("WindProd", identity(n)), ("CapacityWind", -CapFactorWind)], "=", 0)
+    mb.add_rows("SolarProdConstr", [("SolarProd", identity(n)), ("CapacitySolar", -CapFactorSolar)], "=", 0)
+    mb.add_rows("ElectricityProdConstr", [("ElectrisityProd", identity(n)), ("WindProd", -identity(n)), ("SolarProd", -identity(n))], "=", 0)
+
+    # Real world puts limitation on puchased capacity
+    mb.add_rows("WindCapacityConstr", [("CapacityWind", 1)], "<", params["MaxCapacityWind"])
+    mb.add_rows("SolarCapacityConstr", [("CapacitySolar", 1)], "<", params["MaxCapacitySolar"])
+
+    # Production and change in storage needs to meet demand
+    shortfall = [("HydrogenShortfall", identity(nDemand))] if demandShortfallCost is not None else []
+    if initialState is None:
+        mb.add_rows("DemandConstr", [("HydrogenProd", current(n)), ("HydrogenStored", previous(n) - current(n))] + shortfall,
+                    "=", Demand[1:])
+    else:
+        # Every hour, the first one starts from the storage level before the window
+        first = np.zeros(n)
+        first[0] = 1.0
+        mb.add_rows("DemandConstr", [("HydrogenProd", identity(n)), ("HydrogenStored", previous_or_zero(n) - identity(n))]
+                    + shortfall, "=", Demand - first * initialState["HydrogenStored"])
+
+    # July maintenance break PITÄÄ ANTAA VÄHINTÄÄN PARI TUNTIA AIKAA AJAA TAKAISIN TUOTANTO YLÖS!!
+    maintenance = np.flatnonzero(hour_profile([params["MaintenanceHours"]], startHour + n)[startHour:])
+    if maintenance.size:
+        mb.add_rows("MaintBreakConstr", [("HydrogenProd", select(n, maintenance))], "=", 0)
+
+    # There needs to be enough electricity for hydrogen production. Hour 0
+    # charges the battery from the last hour, as ElectricityStored[h-1] did,
+    # or from the battery level before the window.
+    batteryPrevious = previous_cyclic(n) if initialState is None else previous_or_zero(n)
+    electricity = [("HydrogenProd", identity(n)),
+                   ("ElectrisityProd", -EfficiencyElec * identity(n)),
+                   ("ElectricitySold", EfficiencyElec * identity(n)),
+                   ("ElectricityStored", -EfficiencyElec * ChargeEfficiency * (batteryPrevious - identity(n)))]
+    if params["GridBuy"]:
+        electricity.append(("ElectricityBought", -EfficiencyElec * identity(n)))
+    electricityRhs = 0
+    if initialState is not None:
+        electricityRhs = np.zeros(n)
+        electricityRhs[0] = EfficiencyElec * ChargeEfficiency * initialState["ElectricityStored"]
+    mb.add_rows("ElectricityForProdConstr", electricity, "=", electricityRhs)
+
+    if initialState is None:
+        _add_electrolyzer_rows(mb, params)
+    else:
+        _add_electrolyzer_rows(mb, params, change=identity(n) - previous_or_zero(n), before=initialState["HydrogenProd"])
+
+    # Hydrogen storage cannot exceed capacity. Initial condition = 20% of storage, at end must be at least as much
+    if initialState is None:
+        mb.add_rows("CapacityStorageConstr", [("HydrogenStored", current(n)), ("CapacityStorage", -1)], "<", 0)
+        mb.add_rows("StorageInitConditionConstr", [("HydrogenStored", select(n, [0])), ("CapacityStorage", -params["StorageInitShare"])], "=", 0)
+    else:
+        mb.add_rows("CapacityStorageConstr", [("HydrogenStored", identity(n)), ("CapacityStorage", -1)], "<", 0)
+    if endCondition:
+        mb.add_rows("StorageEndConditionConstr", [("HydrogenStored", select(n, [n - 1])), ("CapacityStorage", -params["StorageInitShare"])], ">", 0)
+    if endStorage is not None:
+        mb.add_rows("StorageTargetConstr", [("HydrogenStored", select(n, [n - 1])), ("StorageShortfall", 1)], ">", endStorage)
+
+    # Battery constraints
+    BatteryChange = params["ChargePowerPerc"] * ChargeEfficiency
+    if initialState is None:
+        mb.add_rows("BatteryInitConditionConstr", [("ElectricityStored", select(n, [0])), ("CapacityBattery", -0.2)], "=", 0)  # 20% of capacity
+    if endCondition:
+        mb.add_rows("BatteryEndConditionConstr", [("ElectricityStored", select(n, [n - 1])), ("CapacityBattery", -0.2)], ">", 0)  # 20% of capacity
+    mb.add_rows("CapacityBatteryConstr", [("ElectricityStored", identity(n)), ("CapacityBattery", -params["DepthOfDischarge"])], "<", 0)  # Max battery level 80%
+    if initialState is None:
+        mb.add_rows("BchangeUpConstr", [("ElectricityStored", current(n) - previous(n)), ("CapacityBattery", -BatteryChange)], "<", 0)
+        mb.add_rows("BchangeDownConstr", [("ElectricityStored", previous(n) - current(n)), ("CapacityBattery", -BatteryChange)], "<", 0)
+    else:
+        batteryBefore = np.zeros(n)
+        batteryBefore[0] = initialState["ElectricityStored"]
+        batteryChange = identity(n) - previous_or_zero(n)
+        mb.add_rows("BchangeUpConstr", [("ElectricityStored", batteryChange), ("CapacityBattery", -BatteryChange)], "<", batteryBefore)
+        mb.add_rows("BchangeDownConstr", [("ElectricityStored", -batteryChange), ("CapacityBattery", -BatteryChange)], "<", -batteryBefore)
+
+    #### SET OBJECTIVE
+    PapPriceWind = params["PapPriceWind"]
+    PapPriceSolar = params["PapPriceSolar"]
+    yearWeight = 1.0 / years
+    _add_electrolyzer_obj(mb, params, yearWeight)
+    mb.add_obj("CapacityBattery", params["CapexBattery"] * params["RBattery"] + params["OpexBattery"])
+    mb.add_obj("CapacityWind", PapPriceWind * 7 * 24 * params["Wacc"] + (PapPriceWind + ElecTax + TransmisFee) * CapFactorWind.sum() * yearWeight)
+    mb.add_obj("CapacitySolar", PapPriceSolar * 7 * 24 * params["Wacc"] + (PapPriceSolar + ElecTax + TransmisFee) * CapFactorSolar.sum() * yearWeight)
+    mb.add_obj("ElectricitySold", -(GridPrice + ElecTax + TransmisFee) * yearWeight)
+    if params["GridBuy"]:
+        mb.add_obj("ElectricityBought", (GridPrice + ElecTax + TransmisFee) * yearWeight)
+    if endStorage is not None:
+        mb.add_obj("StorageShortfall", shortfallCost)
+    if demandShortfallCost is not None:
+        mb.add_obj("HydrogenShortfall", demandShortfallCost * yearWeight)
+
+    return mb.finish()
+
+
+def build_base(params, nHours):
+    """Baseload model: wind and solar delivered as constant power during the
+    delivery hours, hydrogen storage, no battery or grid."""
+    n = nHours
+    CapFactorWind = hour_profile(params["DeliveryHours"], n)   # Tuntikohtainen kapasiteettikerroin
+    CapFactorSolar = hour_profile(params["DeliveryHours"], n)
+    Demand = demand_profile(params, n)
+    EfficiencyElec = params["EfficiencyElec"]
+    ElecTax = params["ElecTax"]
+    TransmisFee = params["TransmisFee"]
+    mb = _Assembler("BASE", n, params)
+
+    #### ADD DECISION VARIABLES
+    mb.add_var("CapacityElec")
+    mb.add_var("HydrogenProd", n)       # Hourly hydrogen production (kg)
+    mb.add_var("CapacityWind")          # Ostettu tuulen tuotantokapasiteetti (MW)
+    mb.add_var("WindProd", n)           # multiply helper variable
+    mb.add_var("CapacitySolar")         # Ostettu aurikovoima tuotantokapasiteetti (MW)
+    mb.add_var("SolarProd", n)          # multiply helper variable
+    mb.add_var("CapacityStorage")       # Hydrogen storage capacity (kg)
+    mb.add_var("HydrogenStored", n)     # Hourly storage level of hydrogen(kg)
+    mb.add_var("ElectrisityProd", n)    # CapasityWind * CapFactorWind[h] + CapasitySolar * CapFactorSolar[h]
+
+    #### ADD CONSTRAINTS
+
+    # Constrain definitions for supporting variables
+    mb.add_rows("WindProdConstr", [("WindProd", identity(n)), ("CapacityWind", -CapFactorWind)], "=", 0)
+    mb.add_rows("SolarProdConstr", [("SolarProd", identity(n)), ("CapacitySolar", -CapFactorSolar)], "=", 0)
+    mb.add_rows("ElectricityProdConstr", [("ElectrisityProd", identity(n)), ("WindProd", -identity(n)), ("SolarProd", -identity(n))], "=", 0)
+
+    # Real world puts limitation on puchased capacity
+    mb.add_rows("WindCapacityConstr", [("CapacityWind", 1)], "<", params["MaxCapacityWind"])
+    mb.add_rows("SolarCapacityConstr", [("CapacitySolar", 1)], "<", params["MaxCapacitySolar"])
+
+    # Production and change in storage needs to meet demand
+    mb.add_rows("DemandConstr", [("HydrogenProd", current(n)), ("HydrogenStored", previous(n) - current(n))], "=", Demand[1:])
+
+    # There needs to be enough electricity for hydrogen production
+    mb.add_rows("ElectricityForProdConstr", [("HydrogenProd", identity(n)), ("ElectrisityProd", -EfficiencyElec * identity(n))], "<", 0)
+
+    _add_electrolyzer_rows(mb, params)
+
+    # Hydrogen storage cannot exceed capacity. Initial condition = 4000
+    mb.add_rows("CapacityStorageConstr", [("HydrogenStored", identity(n)), ("CapacityStorage", -1)], "<", 0)
+    mb.add_rows("StorageInitConditionConstr", [("HydrogenStored", select(n, [0]))], "=", params["StorageInit"])
+
+    #### SET OBJECTIVE
+    _add_electrolyzer_obj(mb, params)
+    mb.add_obj("CapacityWind", (params["BasePriceWind"] + ElecTax + TransmisFee) * CapFactorWind.sum())
+    mb.add_obj("CapacitySolar", (params["BasePriceSolar"] + ElecTax + TransmisFee) * CapFactorSolar.sum())
+
+    return mb.finish()
+
+
+def build_pap_days(params, windCF, solarCF, gridPrice, days, years=1):
+    """Pay-as-produced model on representative days.
+
+    days is a representative_days.DayClustering: every calendar day is
+    operated like its representative day (medoid), whose hourly costs are
+    weighted by the number of days it stands for. The battery cycles within
+    the day. The hydrogen storage level of calendar day d is
+    HydrogenStoredDay[d] (level at the start of the day) plus the level
+    HydrogenStoredIntra reached within its representative day, so the storage
+    still carries hydrogen from one day to the next. Capacity costs use the
+    capacity factors of the whole year. years averages the costs over weather
+    years held back to back, as in build_pap.
+    """
+    k = len(days.medoids)
+    H = days.hoursPerDay
+    D = days.nDays
+    n = k * H
+    hours = days.hours()
+    CapFactorWind = np.asarray(windCF, dtype=float)[hours]
+    CapFactorSolar = np.asarray(solarCF, dtype=float)[hours]
+    GridPrice = np.asarray(gridPrice, dtype=float)[hours] * params["GridPriceScale"]
+    Demand = demand_profile(params, D * H)[hours]
+    weights = np.repeat(days.weights, H) / years
+
+    EfficiencyElec = params["EfficiencyElec"]
+    ChargeEfficiency = params["ChargeEfficiency"]
+    ElecTax = params["ElecTax"]
+    TransmisFee = params["TransmisFee"]
+    mb = _Assembler("PAP", n, params)
+
+    def daily(op):
+        """The hourly operator op(H) on every representative day."""
+        return sp.kron(sp.identity(k), op(H), format="csr")
+
+    # Representative day of every calendar day and its last hour
+    dayOf = sp.csr_matrix((np.ones(D), (np.arange(D), days.assignment)), shape=(D, k))
+    endOfDay = select(n, days.assignment * H + H - 1)
+    everyHour = sp.kron(sp.identity(k), np.ones((H, 1)), format="csr")
+
+    #### ADD DECISION VARIABLES
+    mb.add_var("CapacityElec")
+    mb.add_var("HydrogenProd", n)
+    mb.add_var("CapacityWind")
+    mb.add_var("WindProd", n)
+    mb.add_var("CapacitySolar")
+    mb.add_var("SolarProd", n)
+    mb.add_var("CapacityBattery")
+    mb.add_var("ElectricityStored", n)
+    mb.add_var("CapacityStorage")
+    mb.add_var("HydrogenStoredIntra", n, lb=-np.inf)    # Storage level change since the start of the day
+    mb.add_var("HydrogenIntraMax", k, lb=-np.inf)
+    mb.add_var("HydrogenIntraMin", k, lb=-np.inf)
+    mb.add_var("HydrogenStoredDay", D + 1)              # Storage level at the start of every calendar day
+    mb.add_var("ElectricitySold", n)
+    if params["GridBuy"]:
+        mb.add_var("ElectricityBought", n)
+    mb.add_var("ElectrisityProd", n)
+
+    #### ADD CONSTRAINTS
+    mb.add_rows("WindProdConstr", [("WindProd", identity(n)), ("CapacityWind", -CapFactorWind)], "=", 0)
+    mb.add_rows("SolarProdConstr", [("SolarProd", identity(n)), ("CapacitySolar", -CapFactorSolar)], "=", 0)
+    mb.add_rows("ElectricityProdConstr", [("ElectrisityProd", identity(n)), ("WindProd", -identity(n)), ("SolarProd", -identity(n))], "=", 0)
+    mb.add_rows("WindCapacityConstr", [("CapacityWind", 1)], "<", params["MaxCapacityWind"])
+    mb.add_rows("SolarCapacityConstr", [("CapacitySolar", 1)], "<", params["MaxCapacitySolar"])
+
+    # Production and change in storage needs to meet demand, from a zero level at the start of the day
+    mb.add_rows("DemandConstr", [("HydrogenProd", identity(n)), ("HydrogenStoredIntra", daily(previous_or_zero) - identity(n))], "=", Demand)
+
+    maintenance = np.flatnonzero(hour_profile([params["MaintenanceHours"]], D * H)[hours])
+    if maintenance.size:
+        mb.add_rows("MaintBreakConstr", [("HydrogenProd", select(n, maintenance))], "=", 0)
+
+    electricity = [("HydrogenProd", identity(n)),
+                   ("ElectrisityProd", -EfficiencyElec * identity(n)),
+                   ("ElectricitySold", EfficiencyElec * identity(n)),
+                   ("ElectricityStored", -EfficiencyElec * ChargeEfficiency * (daily(previous_cyclic) - identity(n)))]
+    if params["GridBuy"]:
+        electricity.append(("ElectricityBought", -EfficiencyElec * identity(n)))
+    mb.add_rows("ElectricityForProdConstr", electricity, "=", 0)
+
+    _add_electrolyzer_rows(mb, params, change=daily(current) - daily(previous))
+
+    # Hydrogen storage between 0 and its capacity on every hour of every calendar day
+    mb.add_rows("IntraMaxConstr", [("HydrogenStoredIntra", identity(n)), ("HydrogenIntraMax", -everyHour)], "<", 0)
+    mb.add_rows("IntraMinConstr", [("HydrogenStoredIntra", identity(n)), ("HydrogenIntraMin", -everyHour)], ">", 0)
+    mb.add_rows("DayLinkConstr", [("HydrogenStoredDay", current(D + 1) - previous(D + 1)), ("HydrogenStoredIntra", -endOfDay)], "=", 0)
+    mb.add_rows("CapacityStorageConstr", [("HydrogenStoredDay", previous(D + 1)), ("HydrogenIntraMax", dayOf), ("CapacityStorage", -1)], "<", 0)
+    mb.add_rows("StorageLevelConstr", [("HydrogenStoredDay", previous(D + 1)), ("HydrogenIntraMin", dayOf)], ">", 0)
+    mb.add_rows("StorageInitConditionConstr", [("HydrogenStoredDay", select(D + 1, [0])), ("CapacityStorage", -params["StorageInitShare"])], "=", 0)
+    mb.add_rows("StorageEndConditionConstr", [("HydrogenStoredDay", select(D + 1, [D])), ("CapacityStorage", -params["StorageInitShare"])], ">", 0)
+
+    # Battery constraints, cyclic within the day
+    BatteryChange = params["ChargePowerPerc"] * ChargeEfficiency
+    batteryChange = identity(n) - daily(previous_cyclic)
+    mb.add_rows("CapacityBatteryConstr", [("ElectricityStored", identity(n)), ("CapacityBattery", -params["DepthOfDischarge"])], "<", 0)
+    mb.add_rows("BchangeUpConstr", [("ElectricityStored", batteryChange), ("CapacityBattery", -BatteryChange)], "<", 0)
+    mb.add_rows("BchangeDownConstr", [("ElectricityStored", -batteryChange), ("CapacityBattery", -BatteryChange)], "<", 0)
+
+    #### SET OBJECTIVE
+    PapPriceWind = params["PapPriceWind"]
+    PapPriceSolar = params["PapPriceSolar"]
+    _add_electrolyzer_obj(mb, params, weights)
+    mb.add_obj("CapacityBattery", params["CapexBattery"] * params["RBattery"] + params["OpexBattery"])
+    mb.add_obj("CapacityWind", PapPriceWind * 7 * 24 * params["Wacc"] + (PapPriceWind + ElecTax + TransmisFee) * np.sum(windCF[:D * H]) / years)
+    mb.add_obj("CapacitySolar", PapPriceSolar * 7 * 24 * params["Wacc"] + (PapPriceSolar + ElecTax + TransmisFee) * np.sum(solarCF[:D * H]) / years)
+    mb.add_obj("ElectricitySold", -(GridPrice + ElecTax + TransmisFee) * weights)
+    if params["GridBuy"]:
+        mb.add_obj("ElectricityBought", (GridPrice + ElecTax + TransmisFee) * weights)
+
+    return mb.finish()
+
+
+def _add_electrolyzer_rows(mb, params, change=None, before=0.0):
+    """change maps HydrogenProd to its hour-to-hour changes, by default
+    current(n) - previous(n). before is the production of the hour before the
+    first row of change, when that row is the first hour itself."""
+    n = mb.nHours
+    MaxProd = params["EfficiencyElec"]
+    MaxChange = params["Pchange"] * params["EfficiencyElec"]
+    if change is None:
+        change = current(n) - previous(n)
+    rampRhs = np.zeros(change.shape[0])
+    rampRhs[0] = before
+
+    # Hydrogen production cannot exceed capacity
+    mb.add_rows("HydrogenProdCapacityConstr", [("HydrogenProd", identity(n)), ("CapacityElec", -MaxProd)], "<", 0)
+
+    # Constraints for hydrogen production
+    mb.add_rows("PupConstr", [("HydrogenProd", change), ("CapacityElec", -MaxChange)], "<", rampRhs)
+    mb.add_rows("PdownConstr", [("HydrogenProd", -change), ("CapacityElec", -MaxChange)], "<", -rampRhs)
+
+
+def _add_electrolyzer_obj(mb, params, weights=1.0):
+    """weights scales the hourly costs, e.g. by the days a representative day stands for."""
+    mb.add_obj("CapacityElec", params["CapexElec"] * params["RElec"] + params["OpexElec"])
+    mb.add_obj("CapacityStorage", params["CapexStorage"] * params["RStorage"] + params["OpexStorage"])
+    mb.add_obj("HydrogenProd", params["WaterCost"] * weights)
+
+
+#### COSTS
+
+def pap_cost_terms(params, values, windCF, solarCF, gridPrice):
+    """Terms of the build_pap objective for the solution blocks values
+    (capacities and hourly arrays). Annual costs are scaled by the years the
+    hourly arrays cover, so the terms of a one-year solution add up to its
+    objective and longer operation can be costed the same way."""
+    n = len(values["HydrogenProd"])
+    GridPrice = np.asarray(gridPrice[:n], dtype=float) * params["GridPriceScale"]
+    energyPrice = GridPrice + params["ElecTax"] + params["TransmisFee"]
+    totals = {"HydrogenProd": np.sum(values["HydrogenProd"]),
+              "ElectricitySold": np.dot(energyPrice, values["ElectricitySold"])}
+    if params["GridBuy"]:
+        totals["ElectricityBought"] = np.dot(energyPrice, values["ElectricityBought"])
+    return pap_cost_totals(params, values, totals, np.sum(windCF[:n]), np.sum(solarCF[:n]), n / nHoursYear)
+
+
+def pap_cost_totals(params, capacities, totals, windTotal, solarTotal, years):
+    """pap_cost_terms() from the capacities and the totals over the horizon:
+    HydrogenProd (kg), ElectricitySold and ElectricityBought valued at
+    GridPrice + ElecTax + TransmisFee (EUR), and the capacity factor sums
+    windTotal and solarTotal. Capacities and totals may be arrays with one
+    value per design (dispatch_simulator)."""
+    ElecTax = params["ElecTax"]
+    TransmisFee = params["TransmisFee"]
+    terms = {
+        "Electrolyzer": (params["CapexElec"] * params["RElec"] + params["OpexElec"]) * capacities["CapacityElec"] * years,
+        "Storage": (params["CapexStorage"] * params["RStorage"] + params["OpexStorage"]) * capacities["CapacityStorage"] * years,
+        "Battery": (params["CapexBattery"] * params["RBattery"] + params["OpexBattery"]) * capacities["CapacityBattery"] * years,
+        "Water": params["WaterCost"] * totals["HydrogenProd"],
+        "Wind": (params["PapPriceWind"] * 7 * 24 * params["Wacc"] * years
+                 + (params["PapPriceWind"] + ElecTax + TransmisFee) * windTotal) * capacities["CapacityWind"],
+        "Solar": (params["PapPriceSolar"] * 7 * 24 * params["Wacc"] * years
+                  + (params["PapPriceSolar"] + ElecTax + TransmisFee) * solarTotal) * capacities["CapacitySolar"],
+        "Sales": -totals["ElectricitySold"],
+    }
+    if params["GridBuy"]:
+        terms["Purchases"] = totals["ElectricityBought"]
+    return terms
+
+
+#### GUROBI
+
+def to_gurobi(model, m):
+    """Add model to the gurobipy Model m.
+
+    Returns (x, constrs): x maps every variable block name to its MVar (a Var
+    for scalar variables) and constrs maps every row block to its MConstr.
+    """
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    mvars = []
+    x = {}
+    for block, cols in model.varBlocks.items():
+        name = [block] if block in model.scalarVars else block
+        mvar = m.addMVar(cols.stop - cols.start, lb=model.lb[cols], ub=model.ub[cols], obj=model.c[cols], name=name)
+        mvars.append(mvar)
+        x[block] = mvar[0].item() if block in model.scalarVars else mvar
+    xAll = gp.hstack(mvars)
+
+    constrs = {}
+    for block, rows in model.rowBlocks.items():
+        constrs[block] = m.addMConstr(model.A[rows], xAll, model.sense[rows], model.rhs[rows], name=block)
+
+    m.ModelSense = GRB.MINIMIZE
+    m.ObjCon = model.objConstant
+    return x, constrs
+
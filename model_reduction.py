@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# Model reduction in front of optimize()
+#
+# WindProd, SolarProd and ElectrisityProd are helper variables defined only by
+# equality rows, HydrogenProd is fixed to zero on the maintenance hours and a
+# few rows only restate variable bounds. reduce_model() removes all of these
+# from a model_builder.LinearModel with a handful of sparse matrix products:
+#
+#   - singleton rows become variable bounds
+#   - fixed variables are substituted by their value
+#   - empty rows and rows implied by the variable bounds are dropped
+#   - a variable defined by an equality row, x_j = (b - sum a_k x_k) / a_j,
+#     is substituted out when its bounds are implied by the other variables
+#     and the substitution does not add nonzeros
+#
+# Every step maps the remaining variables y back to the original ones as
+# x = T @ y + t, so Postsolve.expand() recovers the full named solution.
+#
+# A reduction step that proves the model infeasible (conflicting bounds, a
+# row no point within the bounds satisfies) gives up, and the model is
+# solved as it is: the solver then reports INFEASIBLE in its result, as
+# without reduction, and a scenario of a grouped job fails on its own.
+
+import numpy as np
+import scipy.sparse as sp
+
+from model_builder import LinearModel
+
+tol = 1e-9
+
+
+class Postsolve:
+    """Maps a solution of the reduced model back to the original columns.
+
+    x = T @ y + t, and rowIndex and colIndex hold the original index of every
+    row and column that was kept in the reduced model.
+    """
+
+    def __init__(self, T, t, rowIndex, colIndex):
+        self.T = T
+        self.t = t
+        self.rowIndex = rowIndex
+        self.colIndex = colIndex
+
+    def expand(self, y):
+        """Full solution vector from a solution y of the reduced model."""
+        return self.T @ np.asarray(y, dtype=float) + self.t
+
+
+def reduce_model(model, substitute=True, maxRounds=20, minShare=1e-3):
+    """Return (reducedModel, postsolve) for a LinearModel.
+
+    Reduction stops once a round shrinks the model by less than minShare of
+    its rows and columns, e.g. when only the storage chain of the zero demand
+    first week is left, which would go one hour per round. A model the
+    reduction proves infeasible is returned as it is (no_reduction), so that
+    the solver reports the status.
+    """
+    red = _Reduction(model)
+    try:
+        for _ in range(maxRounds):
+            size = sum(red.A.shape)
+            red.singleton_rows()
+            red.fixed_columns()
+            red.redundant_rows()
+            if substitute:
+                red.substitute_definitions()
+            if size - sum(red.A.shape) <= minShare * size:
+                break
+    except _Infeasible:
+        return no_reduction(model)
+    return red.result()
+
+
+class _Infeasible(ValueError):
+    """A reduction step found that the model has no feasible point."""
+
+
+class _Reduction:
+
+    def __init__(self, model):
+        self.model = model
+        self.A = model.A.tocsr()
+        self.sense = model.sense.copy()
+        self.rhs = model.rhs.astype(float)
+        self.lb = model.lb.astype(float)
+        self.ub = model.ub.astype(float)
+        self.c = model.c.astype(float)
+        self.objConstant = model.objConstant
+        self.colIndex = np.arange(model.numVars)   # original column of each remaining column
+        self.rowIndex = np.arange(model.numConstrs)
+        self.T = sp.identity(model.numVars, format="csr")
+        self.t = np.zeros(model.numVars)
+
+    #### ROWS
+
+    def singleton_rows(self):
+        """Turn rows with a single nonzero into bounds of that variable."""
+        rowNnz = np.diff(self.A.indptr)
+        rows = np.flatnonzero(rowNnz == 1)
+        if rows.size == 0:
+            return
+        cols = self.A.indices[self.A.indptr[rows]]
+        coeffs = self.A.data[self.A.indptr[rows]]
+        bound = self.rhs[rows] / coeffs
+        sense = self.sense[rows]
+        # a*x <= b is an upper bound for a > 0 and a lower bound for a < 0
+        upper = (sense == "=") | ((sense == "<") & (coeffs > 0)) | ((sense == ">") & (coeffs < 0))
+        lower = (sense == "=") | ((sense == ">") & (coeffs > 0)) | ((sense == "<") & (coeffs < 0))
+        np.minimum.at(self.ub, cols[upper], bound[upper])
+        np.maximum.at(self.lb, cols[lower], bound[lower])
+        infeasible = self.lb > self.ub + tol * np.maximum(1.0, np.abs(self.lb))
+        if infeasible.any():
+            raise _Infeasible("Model is infeasible: bounds of %d variables conflict" % infeasible.sum())
+        self.ub = np.maximum(self.ub, self.lb)
+        self._drop_rows(rows)
+
+    def redundant_rows(self):
+        """Drop empty rows and rows that hold for all x within the bounds."""
+        minAct, maxAct = self._activity_bounds()
+        scale = tol * np.maximum(1.0, np.abs(self.rhs))
+        le = (self.sense == "<") | (self.sense == "=")
+        ge = (self.sense == ">") | (self.sense == "=")
+        if (le & (minAct > self.rhs + scale)).any() or (ge & (maxAct < self.rhs - scale)).any():
+            raise _Infeasible("Model is infeasible: a row cannot be satisfied within the variable bounds")
+        redundant = (~le | (maxAct <= self.rhs + scale)) & (~ge | (minAct >= self.rhs - scale))
+        self._drop_rows(np.flatnonzero(redundant))
+
+    def _activity_bounds(self):
+        """Smallest and largest value of every row activity A @ x."""
+        A = self.A
+        rowOf = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+        lo = np.where(A.data > 0, self.lb[A.indices], self.ub[A.indices]) * A.data
+        hi = np.where(A.data > 0, self.ub[A.indices], self.lb[A.indices]) * A.data
+        bounds = []
+        for act, inf in ((lo, -np.inf), (hi, np.inf)):
+            infinite = np.isinf(act)
+            total = np.bincount(rowOf, np.where(infinite, 0.0, act), minlength=A.shape[0])
+            total[np.bincount(rowOf, infinite, minlength=A.shape[0]) > 0] = inf
+            bounds.append(total)
+        return bounds
+
+    def _drop_rows(self, rows):
+        keep = np.ones(self.A.shape[0], dtype=bool)
+        keep[rows] = False
+        self.A = self.A[keep]
+        self.sense = self.sense[keep]
+        self.rhs = self.rhs[keep]
+        self.rowIndex = self.rowIndex[keep]
+
+    #### COLUMNS
+
+    def fixed_columns(self):
+        """Substitute variables with equal bounds."""
+        fixed = self.lb == self.ub
+        if not fixed.any():
+            return
+        value = np.where(fixed, self.lb, 0.0)
+        keep = np.flatnonzero(~fixed)
+        T = sp.identity(self.A.shape[1], format="csr")[:, keep]
+        self._substitute(T, value, keep)
+
+    def substitute_definitions(self):
+        """Substitute out variables defined by an equality row."""
+        A = self.A
+        At = A.tocsc()
+        colNnz = np.diff(At.indptr) + (self.c != 0)
+        rowNnz = np.diff(A.indptr)
+        rowOf = np.repeat(np.arange(A.shape[0]), rowNnz)
+        col = A.indices
+        coeff = A.data
+
+        # x_j = b / a_j - sum(a_k / a_j * x_k) >= 0 is implied when b / a_j >= 0
+        # and every -a_k / a_j >= 0 with x_k >= 0
+        rowPositive = np.bincount(rowOf, coeff > 0, minlength=A.shape[0])
+        rowNegative = rowNnz - rowPositive
+        rowNonnegVars = np.bincount(rowOf, self.lb[col] >= 0, minlength=A.shape[0]) == rowNnz
+        sign = np.sign(coeff)
+        othersOpposite = np.where(sign > 0, rowPositive[rowOf] == 1, rowNegative[rowOf] == 1)
+        freeCol = np.isneginf(self.lb[col]) & np.isposinf(self.ub[col])
+        implied = (self.lb[col] == 0) & np.isposinf(self.ub[col]) & othersOpposite & rowNonnegVars[rowOf] & (self.rhs[rowOf] * sign >= 0)
+        # Eliminating x_j from its other colNnz - 1 rows adds (colNnz - 1) * (rowNnz - 1) nonzeros and removes colNnz + rowNnz - 1
+        fill = (colNnz[col] - 1) * (rowNnz[rowOf] - 1) <= colNnz[col] + rowNnz[rowOf] - 1
+        candidate = (self.sense[rowOf] == "=") & (rowNnz[rowOf] >= 2) & (implied | freeCol) & fill
+        if not candidate.any():
+            return
+
+        # Pick the sparsest candidate column of every row, then keep one row per
+        # column and only rows that do not contain a column picked by another row
+        entries = np.flatnonzero(candidate)
+        order = entries[np.lexsort((colNnz[col[entries]], rowOf[entries]))]
+        rows, first = np.unique(rowOf[order], return_index=True)
+        pick = order[first]
+        cols = col[pick]
+        cols, firstRow = np.unique(cols, return_index=True)
+        rows = rows[firstRow]
+        pick = pick[firstRow]
+        picked = np.zeros(A.shape[1], dtype=bool)
+        picked[cols] = True
+        pickedInRow = np.bincount(rowOf, picked[col], minlength=A.shape[0])
+        ok = pickedInRow[rows] == 1
+        rows, cols, pick = rows[ok], cols[ok], pick[ok]
+        if rows.size == 0:
+            return
+
+        # x_J = (b_R - A_RK x_K) / a_RJ
+        keep = np.setdiff1d(np.arange(A.shape[1]), cols)
+        d = coeff[pick]
+        defs = (sp.diags(1.0 / d) @ A[rows][:, keep]).tocoo()
+        T = sp.csr_matrix((np.concatenate([np.ones(keep.size), -defs.data]),
+                           (np.concatenate([keep, cols[defs.row]]), np.concatenate([np.arange(keep.size), defs.col]))),
+                          shape=(A.shape[1], keep.size))
+        value = np.zeros(A.shape[1])
+        value[cols] = self.rhs[rows] / d
+        self._drop_rows(rows)
+        self._substitute(T, value, keep)
+
+    def _substitute(self, T, value, keep):
+        """Replace the current columns x by T @ y + value."""
+        self.rhs = self.rhs - self.A @ value
+        self.objConstant += float(self.c @ value)
+        self.A = (self.A @ T).tocsr()
+        self.A.eliminate_zeros()
+        self.c = T.T @ self.c
+        self.t = self.T @ value + self.t
+        self.T = (self.T @ T).tocsr()
+        self.lb = self.lb[keep]
+        self.ub = self.ub[keep]
+        self.colIndex = self.colIndex[keep]
+
+    #### RESULT
+
+    def result(self):
+        model = self.model
+        varBlocks = _blocks(model.varBlocks, self.colIndex)
+        rowBlocks = _blocks(model.rowBlocks, self.rowIndex)
+        reduced = LinearModel(model.name, self.c, self.objConstant, self.lb, self.ub, self.A,
+                              self.sense, self.rhs, varBlocks, rowBlocks,
+                              model.scalarVars & set(varBlocks), model.nHours, model.params)
+        return reduced, Postsolve(self.T, self.t, self.rowIndex, self.colIndex)
+
+
+def _blocks(blocks, index):
+    """Blocks of the kept entries, whose original indices are index (sorted)."""
+    kept = {}
+    for name, s in blocks.items():
+        start, stop = np.searchsorted(index, [s.start, s.stop])
+        if stop > start:
+            kept[name] = slice(int(start), int(stop))
+    return kept
+
+
+def no_reduction(model):
+    """(model, postsolve) pair that leaves model as it is."""
+    return model, Postsolve(sp.identity(model.numVars, format="csr"), np.zeros(model.numVars), np.arange(model.numConstrs), np.arange(model.numVars))
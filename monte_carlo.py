@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# Monte Carlo sizing under price and weather uncertainty
+#
+# Every sample is a resampled year of the hourly wind, solar and price series
+# (seasonal block bootstrap): the year is cut into blocks of blockDays days
+# and every block is replaced by the block that starts a random number of
+# whole days (at most windowDays) earlier or later. The three series take the
+# same blocks, so their correlation, the hour of day and the season of
+# every hour are kept. A sample is drawn from its own seed, so its series
+# are the same whichever worker solves it.
+#
+# Samples are solved in batches by worker processes, each with one
+# ScenarioSolver. The models of a country differ only in coefficients once
+# the capacity factor entries of the matrix are kept as explicit zeros
+# (fixed_pattern), so every solve after the first updates the loaded model
+# and starts from the previous basis with dual simplex (the capacity factors
+# move the matrix, so the old basis is rarely primal feasible). Model
+# reduction drops different zeros in every sample, so reduced models are
+# loaded from scratch each time. Batches are taken in order, and sampling
+# stops once the confidence intervals of the mean objective and capacities
+# are within tolerance of the mean, or at maxSamples.
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import scipy.sparse as sp
+
+from parameters import pap_parameters
+from model_builder import build_pap
+from solver_backends import make_backend
+from scenario_runner import ScenarioSolver
+from sweep import input_series, headers
+from kpis import kpiColumns, run_kpis
+
+#### SELECT SAMPLING
+country = "FI"
+price = "22"
+blockDays = 7  # Days per bootstrap block
+windowDays = 21  # A block is taken from at most this many days earlier or later
+minSamples = 50
+maxSamples = 500
+batchSize = 10  # Samples per job
+tolerance = 0.01  # Stop when every confidence interval half width is below 1 % of its mean
+confidence = 0.95
+tracked = ["Objective", "CapacityElec", "CapacityWind", "CapacitySolar", "CapacityStorage"]
+seed = 2022
+solverBackend = "gurobi"
+reduceModel = False  # Reduced models differ in structure from sample to sample, no warm starts
+workers = 1
+monteCarloOutput = "monte_carlo_PAP_%s_%s.csv" % (country, price)
+
+
+def bootstrap_indices(nHours, rng, blockDays=blockDays, windowDays=windowDays):
+    """Hour indices of one resampled horizon of nHours: every block of
+    blockDays days is replaced by the block shifted by a random number of
+    whole days in [-windowDays, windowDays], wrapping around the horizon."""
+    nDays = -(-nHours // 24)
+    starts = np.arange(0, nDays, blockDays)
+    shifts = rng.integers(-windowDays, windowDays + 1, size=starts.size)
+    days = ((starts + shifts)[:, None] + np.arange(blockDays)[None, :]).ravel()[:nDays] % nDays
+    hours = (days[:, None] * 24 + np.arange(24)[None, :]).ravel()[:nHours]
+    return np.where(hours < nHours, hours, hours - 24)  # Last day of a horizon that ends mid-day
+
+
+def sample_series(series, sample, seed=seed, blockDays=blockDays, windowDays=windowDays):
+    """Resampled copy of the hourly series (wind, solar, price) for sample
+    number sample."""
+    rng = np.random.default_rng([seed, sample])
+    indices = bootstrap_indices(len(series[0]), rng, blockDays, windowDays)
+    return tuple(np.asarray(values, dtype=float)[indices] for values in series)
+
+
+def fixed_pattern(model):
+    """model with explicit zeros at the capacity factor entries of the
+    WindProdConstr and SolarProdConstr rows, so that models of different
+    series have the same nonzero pattern."""
+    A = model.A.tocoo()
+    rows, cols = [A.row], [A.col]
+    for block, var in (("WindProdConstr", "CapacityWind"), ("SolarProdConstr", "CapacitySolar")):
+        blockRows = np.arange(model.rowBlocks[block].start, model.rowBlocks[block].stop)
+        rows.append(blockRows)
+        cols.append(np.full(blockRows.size, model.varBlocks[var].start))
+    data = np.concatenate([A.data, np.zeros(sum(r.size for r in rows[1:]))])
+    model.A = sp.csr_matrix((data, (np.concatenate(rows), np.concatenate(cols))), shape=A.shape)
+    return model
+
+
+def confidence_intervals(rows, names, confidence=confidence):
+    """Mean and confidence interval half width of every column of names
+    over the solved rows (dicts), as {name: (mean, halfWidth)}."""
+    from scipy.stats import t
+
+    summary = {}
+    for name in names:
+        values = np.array([row[name] for row in rows], dtype=float)
+        values = values[np.isfinite(values)]
+        if values.size < 2:
+            summary[name] = (float(values.mean()) if values.size else np.nan, np.inf)
+            continue
+        halfWidth = t.ppf(0.5 + confidence / 2, values.size - 1) * values.std(ddof=1) / np.sqrt(values.size)
+        summary[name] = (float(values.mean()), float(halfWidth))
+    return summary
+
+
+def converged(summary, tolerance=tolerance):
+    return all(halfWidth <= tolerance * abs(mean) for mean, halfWidth in summary.values())
+
+
+def run_monte_carlo(country, price, output, minSamples=minSamples, maxSamples=maxSamples, batchSize=batchSize,
+                    tolerance=tolerance, confidence=confidence, tracked=tracked, seed=seed, blockDays=blockDays,
+                    windowDays=windowDays, workers=1, backend="gurobi", reduce=False, nHours=None, **options):
+    """Solve resampled PAP years of country and price until the tracked
+    columns (Objective and capacities) have converged or maxSamples are
+    solved. Rows of every sample (capacities, objective, key figures) are
+    written to output as their batches complete in order. nHours shortens
+    the horizon, options go to the solver backend (threads defaults to
+    cores // workers). Returns the rows as dicts and the final
+    confidence_intervals() summary."""
+    options.setdefault("threads", max(1, (os.cpu_count() or 1) // max(1, workers)))
+    settings = (country, price, backend, options, reduce, seed, blockDays, windowDays, nHours)
+    batches = [(first, min(first + batchSize, maxSamples)) for first in range(0, maxSamples, batchSize)]
+    columns = ["Sample"] + headers["PAP"][3:-1] + ["Objective", "Status"] + kpiColumns["PAP"]
+    rows = []
+    summary = {}
+
+    with open(output, mode='w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(columns)
+
+        def collect(batchRows):
+            # True when sampling can stop
+            writer.writerows([[row[name] for name in columns] for row in batchRows])
+            output_file.flush()
+            rows.extend(batchRows)
+            solved = [row for row in rows if row["Status"] == "OPTIMAL"]
+            summary.update(confidence_intervals(solved, tracked, confidence))
+            print("%d samples: " % len(rows) + ", ".join("%s %.5g +- %.2g" % (name, *summary[name]) for name in tracked))
+            return len(solved) >= minSamples and converged(summary, tolerance)
+
+        if workers <= 1:
+            _init_worker(*settings)
+            try:
+                for batch in batches:
+                    if collect(_run_batch(batch)):
+                        break
+            finally:
+                _release_worker()
+        else:
+            # workers batches in flight; results are taken in batch order so
+            # that the samples used do not depend on which worker is faster
+            with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=settings) as pool:
+                pending = {}
+                done = {}
+                nextBatch = 0
+                nextResult = 0
+                stop = False
+                while not stop and nextResult < len(batches):
+                    while nextBatch < len(batches) and len(pending) < workers:
+                        pending[pool.submit(_run_batch, batches[nextBatch])] = nextBatch
+                        nextBatch += 1
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done[pending.pop(future)] = future.result()
+                    while nextResult in done and not stop:
+                        stop = collect(done.pop(nextResult))
+                        nextResult += 1
+                for future in pending:
+                    future.cancel()
+    return rows, summary
+
+
+#### WORKER
+
+_solver = None
+_context = None
+
+
+def _start_worker(*settings):
+    # Pool processes exit through os._exit, so the solver is released by a
+    # multiprocessing finalizer rather than atexit (as in sweep.py)
+    from multiprocessing.util import Finalize
+
+    _init_worker(*settings)
+    Finalize(None, _release_worker, exitpriority=10)
+
+
+def _init_worker(country, price, backend, options, reduce, seed, blockDays, windowDays, nHours):
+    global _solver, _context
+    _solver = ScenarioSolver(make_backend(backend, **options), reduce=reduce, warmStart=True, warmMethod="dual")
+    params = pap_parameters(country, price)
+    series = input_series("PAP", country)
+    if nHours is not None:
+        series = tuple(np.asarray(values)[:nHours] for values in series)
+    _context = dict(params=params, series=series, seed=seed, blockDays=blockDays, windowDays=windowDays)
+
+
+def _release_worker():
+    global _solver
+    if _solver is not None:
+        _solver.dispose()
+        _solver = None
+
+
+def _run_batch(batch):
+    params = _context["params"]
+    batchRows = []
+    for sample in range(*batch):
+        windRaw, solarRaw, priceRaw = sample_series(_context["series"], sample, _context["seed"], _context["blockDays"],
+                                                    _context["windowDays"])
+        model = fixed_pattern(build_pap(params, windRaw, solarRaw, priceRaw))
+        result = _solver.solve(model)
+        row = dict(Sample=sample, Objective=result.objective, Status=result.status)
+        if result.x is not None:
+            values = model.split(result.x)
+            row.update((name, values[name]) for name in headers["PAP"][3:-1])
+            row.update(run_kpis("PAP", params, values, result.objective, priceRaw))
+        else:
+            row.update(dict.fromkeys(headers["PAP"][3:-1] + kpiColumns["PAP"], np.nan))
+        batchRows.append(row)
+    return batchRows
+
+
+if __name__ == "__main__":
+    rows, summary = run_monte_carlo(country, price, monteCarloOutput, workers=workers, backend=solverBackend,
+                                    reduce=reduceModel)
+    for name, (mean, halfWidth) in summary.items():
+        print("%s: %.6g +- %.3g (%d%% confidence, %d samples)" % (name, mean, halfWidth, 100 * confidence, len(rows)))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Scenario parameters of the PAP and BASE hydrogen models
+#
+# The values are the ones the model scripts used to define inline. Every
+# parameter set is a plain dict keyed by the same names the scripts use, so a
+# scenario can be tweaked with params["CapexElec"] = ... before building.
+
+import numpy as np
+
+# number of hours
+nHoursYear = 8784          # 366*24 (karkausvuosi)
+
+
+def pap_parameters(country, price, scenario=None):
+    """Parameters of the pay-as-produced (PAP) model for country FI, SE or DE
+    and PAP price year "22" (2022 Q4) or "20" (2020 Q4)."""
+    params = {
+        "Contract": "PAP",
+        "Country": country,
+        "Price": price,
+
+        # Demand
+        "DemandLevel": 2000,                       # kg H2 / h
+        "DemandHours": [(168, 5065), (5809, None)],  # January-June production. First week no demand (otherwise too big constraint on wind / solar capacity). July maintenance break and after full steam.
+        "MaintenanceHours": (5065, 5806),          # July maintenance break, no hydrogen production
+
+        # Electrolyzer
+        "CapexElec": 845000,     # € / MWe
+        "OpexElec": 16900,       # € / MWe
+        "EfficiencyElec": 15.6,  # kg H2 / MWHe
+        "Pchange": 0.50,         # 50% muutos maksimikapasiteetista tunnissa
+        "RElec": 0.171,          # annuiteettikerroin
+
+        # Real world puts limitation on puchased capacity
+        "MaxCapacityWind": 1000,
+        "MaxCapacitySolar": 1000,
+
+        # Battery
+        "DepthOfDischarge": 0.8,
+        "CapexBattery": 378798,
+        "OpexBattery": 7576,
+        "ChargeEfficiency": 0.93,
+        "ChargePowerPerc": 0.43,  # Charge rate as a ratio of max capacity
+        "RBattery": 0.147,        # annuiteettikerroin
+
+        # Storage
+        "CapexStorage": 80.90,   # € / kg
+        "OpexStorage": 3.24,     # € / kg
+        "RStorage": 0.092,       # annuiteettikerroin
+        "StorageInitShare": 0.2,  # Initial storage level as share of capacity, at end must be at least as much
+
+        # Grid
+        "GridBuy": country == "SE",  # Electricity can be bought from the grid only in Sweden
+        "GridPriceScale": 1.0,
+
+        # WACC
+        "Wacc": 0.078,
+
+        # Water
+        "WaterCost": 0.07,  # € / kg H2
+    }
+
+    # PPA pay-as-produced hinta (€ / MWhh), sähkönvero (€ / MWh), sähkönsiirtomaksu (€ / MWh)
+    if country == "FI":
+        params["PapPriceWind"] = 52 if price == "22" else 30
+        params["PapPriceSolar"] = 38 if price == "22" else 35
+        params["ElecTax"] = 0.63
+        params["TransmisFee"] = 4.0
+    elif country == "SE":
+        params["PapPriceWind"] = 69 if price == "22" else 50
+        params["PapPriceSolar"] = 54 if price == "22" else 35
+        params["ElecTax"] = 0
+        params["TransmisFee"] = 0.91
+    else:
+        params["PapPriceWind"] = 64 if price == "22" else 55
+        params["PapPriceSolar"] = 89 if price == "22" else 49
+        params["ElecTax"] = 0
+        params["TransmisFee"] = 12
+
+    return apply_scenario(params, scenario)
+
+
+def base_parameters(country, price, scenario=None):
+    """Parameters of the baseload (BASE) model, see pap_parameters()."""
+    params = {
+        "Contract": "BASE",
+        "Country": country,
+        "Price": price,
+
+        # Demand
+        "DemandLevel": 2000,
+        "DemandHours": [(0, 5065), (5809, None)],  # January-June production, July maintenance break and after full steam.
+        "DeliveryHours": [(0, 5065), (5805, None)],  # Hours the baseload contracts deliver (Tuntikohtainen kapasiteettikerroin 1)
+
+        # Electrolyzer
+        "CapexElec": 845000,     # € / MWe
+        "OpexElec": 16900,       # € / MWe
+        "EfficiencyElec": 15.6,  # kg H2 / MWHe
+        "Pchange": 0.50,         # 50% muutos maksimikapasiteetista tunnissa
+        "RElec": 0.171,          # annuiteettikerroin
+
+        # Real world puts limitation on puchased capacity
+        "MaxCapacityWind": 200,
+        "MaxCapacitySolar": 200,
+
+        # Storage
+        "CapexStorage": 80.90,   # € / kg
+        "OpexStorage": 3.24,     # € / kg
+        "RStorage": 0.092,       # annuiteettikerroin
+        "StorageInit": 4000,     # Initial storage level (kg)
+
+        # Water
+        "WaterCost": 0.07,  # € / kg H2
+    }
+
+    # PPA baseload hinta (€ / MWh), sähkönvero (€ / MWh), sähkönsiirtomaksu (€ / MWh)
+    if country == "FI":
+        params["BasePriceWind"] = 54.6 if price == "22" else 31.5
+        params["BasePriceSolar"] = 39.9 if price == "22" else 36.8
+        params["ElecTax"] = 0.63
+        params["TransmisFee"] = 4.0
+    elif country == "SE":
+        params["BasePriceWind"] = 72.45 if price == "22" else 52
+        params["BasePriceSolar"] = 57.6 if price == "22" else 36.8
+        params["ElecTax"] = 0
+        params["TransmisFee"] = 0.91
+    else:
+        params["BasePriceWind"] = 67.2 if price == "22" else 57.8
+        params["BasePriceSolar"] = 93.45 if price == "22" else 51.5
+        params["ElecTax"] = 0
+        params["TransmisFee"] = 12
+
+    return apply_scenario(params, scenario)
+
+
+def apply_scenario(params, scenario):
+    """Return a copy of params with a sensitivity scenario applied."""
+    params = dict(params)
+    if scenario is None or scenario == "Base":
+        pass
+    elif scenario == "GridPriceDown":
+        params["GridPriceScale"] = 0.8   # 20 % decrease
+    elif scenario == "GridPriceUp":
+        params["GridPriceScale"] = 1.2   # 20 % increase
+    elif scenario == "CapexElecDown":
+        params["CapexElec"] = params["CapexElec"] * 0.8
+        params["OpexElec"] = params["OpexElec"] * 0.8
+    elif scenario == "CapexElecUp":
+        params["CapexElec"] = params["CapexElec"] * 1.2
+        params["OpexElec"] = params["OpexElec"] * 1.2
+    elif scenario == "RElecDown":
+        params["RElec"] = 0.148
+    elif scenario == "RElecUp":
+        params["RElec"] = 0.207
+    elif scenario == "EfficiencyElecDown":
+        params["EfficiencyElec"] = params["EfficiencyElec"] * 0.8
+    elif scenario == "EfficiencyElecUp":
+        params["EfficiencyElec"] = params["EfficiencyElec"] * 1.2
+    else:
+        raise ValueError("Unknown sensitivity scenario: " + str(scenario))
+    params["Scenario"] = scenario if scenario is not None else "Base"
+    return params
+
+
+def hour_profile(windows, nHours, value=1.0):
+    """Hourly profile that is value inside the (start, end) hour windows of a
+    year and zero elsewhere. Horizons longer than a year repeat the profile."""
+    yearProfile = np.zeros(nHoursYear)
+    for start, end in windows:
+        yearProfile[start:end] = value
+    return np.resize(yearProfile, nHours)
+
+
+def demand_profile(params, nHours):
+    """Hourly hydrogen demand (kg)."""
+    return hour_profile(params["DemandHours"], nHours, params["DemandLevel"])
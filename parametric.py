@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Parametric sweeps of one parameter with LP ranging
+#
+# A fine sweep of PapPriceWind, PapPriceSolar or CapexElec moves a single
+# objective coefficient (the cost of CapacityWind, CapacitySolar or
+# CapacityElec), and MaxCapacityWind or MaxCapacitySolar a single bound of the
+# reduced model. After each solve the ranging attributes of that coefficient
+# (SAObjLow/SAObjUp, SARHSLow/SARHSUp, SALBLow/SAUBUp, ...) give the interval
+# of the parameter in which the optimal basis stays optimal. Inside it:
+#
+#   - an objective coefficient leaves the solution unchanged and moves the
+#     objective linearly, so the steps are computed without solving
+#   - a right-hand side or bound moves the solution and the objective
+#     linearly, so the last step inside the interval is solved from the same
+#     basis (no iterations) and the steps in between are interpolated
+#
+# Only a step past the interval is solved again, warm-started from the last
+# basis with primal (objective) or dual simplex (right-hand side, bounds).
+# A parameter that moves more than one coefficient (GridPriceScale,
+# EfficiencyElec) and backends without ranging (HiGHS) fall back to solving
+# every step.
+
+import csv
+
+import numpy as np
+
+from parameters import nHoursYear
+from model_builder import build_pap, build_base
+from model_reduction import reduce_model, no_reduction
+from solver_backends import make_backend
+from sweep import headers, input_series, scenario_parameters
+from kpis import kpiColumns, run_kpis
+
+#### SELECT SWEEP
+kind = "PAP"  # PAP or BASE
+country = "FI"  # FI, SE or DE
+price = "22"  # 22 or 20
+parameter = "PapPriceWind"  # e.g. PapPriceSolar, CapexElec, MaxCapacityWind
+relativeSteps = np.linspace(0.5, 1.5, 201)  # Values as multiples of the base scenario value
+solverBackend = "gurobi"  # gurobi (ranging) or highs (solves every step)
+reduceModel = True
+parametricOutput = "parametric_%s_%s_%s_%s.csv" % (kind, country, price, parameter)
+
+SOLVED = "solve"
+RANGING = "ranging"
+
+
+def parametric_solve(build, params, parameter, values, backend, reduce=True):
+    """Solve build(params) with params[parameter] set to every value of
+    values, solving only where the optimal basis changes.
+
+    Returns one (x, objective, how) per value in the order of values, where
+    x is the solution of the full model (None without a solution) and how
+    is SOLVED or RANGING.
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values, kind="stable")
+    steps = values[order]
+
+    def reduced_at(value):
+        p = dict(params)
+        p[parameter] = value
+        model = build(p)
+        return reduce_model(model) if reduce else no_reduction(model)
+
+    first = reduced_at(steps[0])
+    last = reduced_at(steps[-1]) if steps[-1] != steps[0] else first
+    direction = model_direction(first[0], last[0], steps[-1] - steps[0])
+
+    outcomes = [None] * len(steps)
+    start = None
+    i = 0
+    while i < len(steps):
+        solveModel, postsolve = first if i == 0 else reduced_at(steps[i])
+        result = solve_warm(backend, solveModel, start, direction)
+        x = postsolve.expand(result.x) if result.x is not None else None
+        outcomes[i] = (x, result.objective, SOLVED)
+        start = backend.start() if result.optimal else None
+        interval = parameter_range(backend, solveModel, direction, steps[i]) if result.optimal else None
+        if interval is None:
+            i += 1
+            continue
+
+        # Steps on the same basis
+        j = i
+        while j + 1 < len(steps) and steps[j + 1] <= interval[1]:
+            j += 1
+        if j > i:
+            attr, index, slope, constantSlope = direction
+            if attr == "c":
+                # Same solution, the coefficient times its column moves the objective
+                columnSlope = slope * result.x[index] if index is not None else 0.0
+                for k in range(i + 1, j + 1):
+                    change = (steps[k] - steps[i]) * (columnSlope + constantSlope)
+                    outcomes[k] = (x, result.objective + change, RANGING)
+            else:
+                endModel, endPostsolve = reduced_at(steps[j])
+                end = solve_warm(backend, endModel, start, direction)
+                if end.x is None:
+                    i += 1
+                    continue
+                xEnd = endPostsolve.expand(end.x)
+                outcomes[j] = (xEnd, end.objective, SOLVED)
+                for k in range(i + 1, j):
+                    share = (steps[k] - steps[i]) / (steps[j] - steps[i])
+                    outcomes[k] = (x + share * (xEnd - x), result.objective + share * (end.objective - result.objective),
+                                   RANGING)
+                start = backend.start() if end.optimal else None
+        i = j + 1
+
+    ordered = [None] * len(steps)
+    for k, position in enumerate(order):
+        ordered[position] = outcomes[k]
+    return ordered
+
+
+def run_parametric(kind, country, price, parameter, values, output, backend="gurobi", reduce=True, nHours=None, **options):
+    """Parametric sweep of parameter over values for a PAP or BASE model of
+    country and price. Rows (capacities, objective, whether the step was
+    solved, key figures) are written to output and returned. nHours
+    shortens the horizon, options go to the solver backend."""
+    series = input_series(kind, country)
+    params = scenario_parameters(kind, country, price, None)
+
+    def build(p):
+        if kind == "PAP":
+            return build_pap(p, *series, nHours=nHours)
+        return build_base(p, nHours or nHoursYear)
+
+    solver = make_backend(backend, **options)
+    try:
+        outcomes = parametric_solve(build, params, parameter, values, solver, reduce)
+    finally:
+        solver.dispose()
+
+    layout = build(params)  # blocks of the solution vectors
+    capacities = headers[kind][3:-1]
+    rows = []
+    for value, (x, objective, how) in zip(values, outcomes):
+        row = [country, price, parameter, value]
+        if x is None:
+            rows.append(row + [np.nan] * len(capacities) + [objective, how] + [np.nan] * len(kpiColumns[kind]))
+            continue
+        blocks = layout.split(x)
+        p = dict(params)
+        p[parameter] = value
+        kpis = run_kpis(kind, p, blocks, objective, series[2] if kind == "PAP" else None)
+        rows.append(row + [blocks[name] for name in capacities] + [objective, how] + [kpis[name] for name in kpiColumns[kind]])
+    with open(output, mode='w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['Country', 'PAP Year', 'Parameter', 'Value'] + capacities + ['Objective', 'Solved'] + kpiColumns[kind])
+        writer.writerows(rows)
+    return rows
+
+
+def model_direction(model, other, distance):
+    """How the solved model moves with the parameter: (attr, index, slope,
+    constantSlope) when exactly one entry of c, rhs, lb or ub changes
+    between model and other, distance apart in the parameter, and the
+    matrix stays the same. ("c", None, 0, constantSlope) when only the
+    objective constant changes, None otherwise."""
+    if distance == 0 or not model.same_structure(other):
+        return None
+    A, B = model.A.tocsr(), other.A.tocsr()
+    A.sort_indices()
+    B.sort_indices()
+    if not np.allclose(A.data, B.data):
+        return None
+    changed = []
+    for attr in ("c", "rhs", "lb", "ub"):
+        a, b = getattr(model, attr), getattr(other, attr)
+        for index in np.flatnonzero(~np.isclose(a, b, rtol=1e-12, atol=0.0)):
+            changed.append((attr, int(index), (b[index] - a[index]) / distance))
+    constantSlope = (other.objConstant - model.objConstant) / distance
+    if not changed:
+        return "c", None, 0.0, constantSlope
+    if len(changed) > 1:
+        return None
+    attr, index, slope = changed[0]
+    return attr, index, slope, constantSlope
+
+
+def parameter_range(backend, model, direction, value):
+    """Interval of the parameter around value in which the basis of the
+    last solve stays optimal, None if unknown."""
+    if direction is None:
+        return None
+    attr, index, slope, constantSlope = direction
+    if index is None:
+        return -np.inf, np.inf  # the solved model does not change
+    ranging = backend.ranging(attr, index)
+    if ranging is None:
+        return None
+    coefficient = getattr(model, attr)[index]
+    low, up = (ranging[0] - coefficient) / slope, (ranging[1] - coefficient) / slope
+    return value + min(low, up), value + max(low, up)
+
+
+def solve_warm(backend, model, start, direction):
+    """Solve model on backend, updating the loaded model in place and
+    starting from the basis start when there is one."""
+    loaded = backend.model
+    if loaded is not None and loaded.same_structure(model):
+        backend.update(model)
+        if start is not None:
+            # The old basis stays primal feasible when only costs change
+            method = "primal" if direction is not None and direction[0] == "c" else "dual"
+            backend.warm_start(start, method)
+    else:
+        backend.load(model)
+    return backend.optimize()
+
+
+if __name__ == "__main__":
+    base = scenario_parameters(kind, country, price, None)[parameter]
+    values = list(base * relativeSteps)
+    rows = run_parametric(kind, country, price, parameter, values, parametricOutput, backend=solverBackend, reduce=reduceModel)
+    solves = sum(1 for row in rows if row[4 + len(headers[kind][3:-1]) + 1] == SOLVED)
+    print("%s %s: %d steps, %d solves" % (parameter, parametricOutput, len(rows), solves))
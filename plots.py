@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Storage and dispatch charts of solved runs
+#
+# run_figure() draws the two charts of main.py (hydrogen storage level and
+# production against demand, electricity production, use and sales) into one
+# figure. Every series is downsampled to its minimum and maximum per bucket
+# of hours, which keeps the peaks and troughs of 8784-hour series with a few
+# hundred points per line. plot_sweep() renders the charts of a whole sweep
+# from result_cache in parallel worker processes on the non-interactive Agg
+# canvas, so nothing waits for a window.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from parameters import demand_profile
+
+defaultPoints = 1000  # Points per line
+
+
+def downsample(y, points=defaultPoints):
+    """(hours, values) of y reduced to the minimum and maximum of
+    points // 2 buckets, in hour order. Short series are returned as they are."""
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if n <= points:
+        return np.arange(n), y
+    size = -(-n // max(points // 2, 1))  # Hours per bucket
+    m = -(-n // size)
+    blocks = np.full(m * size, np.nan)
+    blocks[:n] = y
+    blocks = blocks.reshape(m, size)
+    low = np.nanargmin(blocks, axis=1)
+    high = np.nanargmax(blocks, axis=1)
+    hours = (np.arange(m)[:, None] * size + np.sort(np.stack([low, high], axis=1), axis=1)).ravel()
+    return hours, y[hours]
+
+
+def run_figure(kind, values, demand, title="", points=defaultPoints, figure=None):
+    """Storage and dispatch charts of a PAP or BASE run (values as returned
+    by model.split()) in figure, by default a new Agg figure."""
+    if figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=(12, 8))
+        FigureCanvasAgg(figure)
+    storage, dispatch = figure.subplots(2, 1, sharex=True)
+
+    def line(ax, y, **style):
+        ax.plot(*downsample(y, points), lw=0.8, **style)
+
+    line(storage, values["HydrogenStored"], color='orange', label='Storage level')
+    storage.axhline(values["CapacityStorage"], color='orange', ls='--', label='Max Storage')
+    line(storage, values["HydrogenProd"], color='blue', label='Hydrogen production')
+    line(storage, demand, color='blue', ls='--', label='Demand')
+    storage.legend(loc='best')
+
+    line(dispatch, values["SolarProd"], color='blue', label='Solar production')
+    line(dispatch, values["WindProd"], color='black', label='Wind production')
+    if kind == "PAP":
+        used = values["SolarProd"] + values["WindProd"] - values["ElectricityStored"] - values["ElectricitySold"]
+        line(dispatch, values["ElectricityStored"], color='orange', label='Battery level')
+        dispatch.axhline(values["CapacityBattery"], color='orange', ls='--', label='Max battery capacity')
+        line(dispatch, values["ElectricitySold"], color='red', label='Electricity sold')
+    else:
+        used = values["SolarProd"] + values["WindProd"]
+    line(dispatch, used, color='green', label='Electricity used')
+    dispatch.legend(loc='best')
+    dispatch.set_xlabel('Hour')
+    if title:
+        figure.suptitle(title)
+    return figure
+
+
+def plot_sweep(kind, jobs, outputDir, workers=None, points=defaultPoints):
+    """Render the charts of every scenario of the sweep jobs (see
+    sweep.sweep_jobs) whose result is in result_cache to
+    outputDir/<kind>_<country>_<price>_<scenario>.png. Returns the written
+    files, None for scenarios without a cached result."""
+    os.makedirs(outputDir, exist_ok=True)
+    tasks = [(kind, country, price, scenario, outputDir, points)
+             for country, price, scenarios in jobs for scenario in scenarios]
+    if workers is not None and workers <= 1:
+        return [_render_scenario(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_scenario, *zip(*tasks))) if tasks else []
+
+
+def _render_scenario(kind, country, price, scenario, outputDir, points):
+    from sweep import scenario_parameters, input_series
+    from result_cache import scenario_key, load_result
+
+    params = scenario_parameters(kind, country, price, scenario)
+    found = load_result(scenario_key(kind, params, input_series(kind, country)))
+    if found is None:
+        return None
+    values, objective = found
+    demand = demand_profile(params, len(values["HydrogenProd"]))
+    figure = run_figure(kind, values, demand, "%s %s %s %s: %.4g" % (kind, country, price, scenario, objective), points)
+    path = os.path.join(outputDir, "%s_%s_%s_%s.png" % (kind, country, price, scenario))
+    figure.savefig(path, dpi=100, pil_kwargs={"compress_level": 1})  # PNG encoding was a quarter of the time
+    return path
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Representative days for fast screening solves
+#
+# cluster_days() groups the 366 days of the year by their hourly wind, solar
+# and price profiles with k-medoids. Days with a different demand or
+# maintenance profile (the zero demand first week, the July maintenance
+# break and the days where these start or end) are clustered separately, so
+# every representative day has the calendar of the days it stands for.
+# model_builder.build_pap_days() builds the PAP model on the medoid days,
+# a few thousand variables instead of 70k, and full_year() maps its solution
+# back to hourly series of the whole year.
+
+import numpy as np
+
+from parameters import demand_profile, hour_profile
+from model_builder import capacityNames
+
+
+class DayClustering:
+    """Calendar days mapped to representative days.
+
+    medoids holds the calendar day of every representative day and
+    assignment the representative day (index into medoids) of every
+    calendar day.
+    """
+
+    hoursPerDay = 24
+
+    def __init__(self, medoids, assignment):
+        self.medoids = np.asarray(medoids)
+        self.assignment = np.asarray(assignment)
+
+    @property
+    def nDays(self):
+        return self.assignment.size
+
+    @property
+    def weights(self):
+        """Number of calendar days of every representative day."""
+        return np.bincount(self.assignment, minlength=self.medoids.size)
+
+    def hours(self):
+        """Hours of the year of the representative days, day by day."""
+        H = self.hoursPerDay
+        return (self.medoids[:, None] * H + np.arange(H)).ravel()
+
+
+def cluster_days(params, windCF, solarCF, gridPrice, nDays, seed=0, maxIter=100):
+    """Cluster the days of the year into nDays representative days."""
+    H = DayClustering.hoursPerDay
+    D = len(windCF) // H
+    price = np.asarray(gridPrice[:D * H], dtype=float)
+    price = (price - price.mean()) / max(price.std(), 1e-9)
+    features = np.hstack([np.asarray(windCF[:D * H], dtype=float).reshape(D, H),
+                          np.asarray(solarCF[:D * H], dtype=float).reshape(D, H),
+                          price.reshape(D, H)])
+
+    # Days with the same demand and maintenance hours
+    calendar = np.hstack([demand_profile(params, D * H).reshape(D, H),
+                          hour_profile([params["MaintenanceHours"]], D * H).reshape(D, H)])
+    _, group = np.unique(calendar, axis=0, return_inverse=True)
+    group = group.ravel()
+    sizes = np.bincount(group)
+    if nDays < sizes.size:
+        raise ValueError("At least %d representative days are needed, one per calendar type" % sizes.size)
+
+    rng = np.random.default_rng(seed)
+    medoids = []
+    assignment = np.empty(D, dtype=int)
+    for g, k in enumerate(_allocate(sizes, nDays)):
+        days = np.flatnonzero(group == g)
+        groupMedoids, labels = _k_medoids(features[days], k, rng, maxIter)
+        assignment[days] = len(medoids) + labels
+        medoids.extend(days[groupMedoids])
+    return DayClustering(medoids, assignment)
+
+
+def _allocate(sizes, total):
+    """Representative days per group: proportional to the group sizes, at
+    least one and at most the group size."""
+    share = sizes * total / sizes.sum()
+    k = np.clip(np.floor(share).astype(int), 1, sizes)
+    while k.sum() < total:
+        free = np.flatnonzero(k < sizes)
+        if free.size == 0:
+            break
+        k[free[np.argmax((share - k)[free])]] += 1
+    while k.sum() > total:
+        k[np.argmax(np.where(k > 1, k - share, -np.inf))] -= 1
+    return k
+
+
+def _k_medoids(X, k, rng, maxIter):
+    """k-medoids (alternating updates from a k-medoids++ start). Returns the
+    medoid rows and the cluster of every row."""
+    n = X.shape[0]
+    if k >= n:
+        return np.arange(n), np.arange(n)
+    dist = np.sqrt(((X[:, None, :] - X[None, :, :]) ** 2).sum(axis=2))
+
+    medoids = [int(rng.integers(n))]
+    for _ in range(1, k):
+        d = dist[:, medoids].min(axis=1) ** 2
+        medoids.append(int(rng.choice(n, p=d / d.sum())) if d.sum() > 0 else int(rng.integers(n)))
+    medoids = np.array(medoids)
+
+    for _ in range(maxIter):
+        labels = np.argmin(dist[:, medoids], axis=1)
+        new = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if members.size:
+                new[c] = members[np.argmin(dist[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(new, medoids):
+            break
+        medoids = new
+    return medoids, np.argmin(dist[:, medoids], axis=1)
+
+
+def full_year(values, days):
+    """Hourly series of the whole year from the solution blocks values of a
+    build_pap_days() model, named like the blocks of build_pap()."""
+    H = days.hoursPerDay
+    k = days.medoids.size
+    series = {}
+    for name, value in values.items():
+        if np.ndim(value) == 0:
+            series[name] = value
+        elif np.size(value) == k * H and name != "HydrogenStoredIntra":
+            series[name] = np.asarray(value).reshape(k, H)[days.assignment].ravel()
+    intra = np.asarray(values["HydrogenStoredIntra"]).reshape(k, H)[days.assignment]
+    series["HydrogenStored"] = (values["HydrogenStoredDay"][:-1, None] + intra).ravel()
+    return series
+
+
+def screening_gap(values, objective, fullValues, fullObjective):
+    """Relative difference of the capacities and the objective of a
+    representative day solve to the full-year solve."""
+    gap = {}
+    for name in capacityNames + ["Objective"]:
+        approx, full = (objective, fullObjective) if name == "Objective" else (values.get(name), fullValues.get(name))
+        if approx is None or full is None:
+            continue
+        gap[name] = (approx - full) / abs(full) if full != 0 else approx - full
+    return gap
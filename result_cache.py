@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Content-addressed cache of scenario results
+#
+# A scenario result is stored under the SHA-256 of everything that determines
+# it: the model kind, the full parameter dict, the hourly input series and
+# modelVersion. Re-running a sweep after changing one scenario therefore only
+# solves that scenario; the others are read from .cache/results/<key>.npz,
+# which holds the objective and every solution block (capacities and hourly
+# arrays) under its variable name.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from input_data import cacheDir
+
+# Bump when the formulation in model_builder changes, so old results are not
+# served for the new model
+modelVersion = "1"
+
+resultDir = os.path.join(cacheDir, "results")
+
+
+def scenario_key(kind, params, series=()):
+    """Cache key of a PAP or BASE scenario with parameters params and the
+    hourly input series (wind, solar, price arrays) it is built from."""
+    digest = hashlib.sha256()
+    digest.update(("%s|%s|" % (modelVersion, kind)).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    for values in series:
+        digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def load_result(key):
+    """Cached (values, objective) of key, or None. values maps every variable
+    block to its solution, floats for the capacities."""
+    path = os.path.join(resultDir, key + ".npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        values = {name: data[name] for name in data.files if name != "_objective"}
+        objective = float(data["_objective"])
+    for name, value in values.items():
+        if value.ndim == 0:
+            values[name] = float(value)
+    return values, objective
+
+
+def save_result(key, values, objective):
+    """Store the solution blocks values and the objective under key."""
+    os.makedirs(resultDir, exist_ok=True)
+    path = os.path.join(resultDir, key + ".npz")
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, _objective=objective, **values)
+    os.replace(tmp, path)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# SQLite store of model results
+#
+# Every run, whether from main.py, base.py, a sensitivity sweep or one of the
+# old output CSV files, is one row of the runs table: model (PAP or BASE),
+# country, PAP price year, scenario, weather years, the capacities and the
+# objective, with indexes on the columns runs are looked up by. The hourly
+# series of a run, where there are any, are zlib-compressed float64 blobs in
+# the series table, so comparing runs never re-reads the CSV files.
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from input_data import dataDir
+from model_builder import capacityNames
+
+defaultPath = os.path.join(dataDir, "results.sqlite")
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    source TEXT,
+    model TEXT NOT NULL,
+    country TEXT NOT NULL,
+    price TEXT,
+    scenario TEXT NOT NULL,
+    weatherYears TEXT,
+    %s,
+    objective REAL,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+CREATE INDEX IF NOT EXISTS runs_country ON runs (country);
+CREATE INDEX IF NOT EXISTS runs_price ON runs (price);
+CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario);
+CREATE TABLE IF NOT EXISTS series (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run, name)
+);
+""" % ",\n    ".join("%s REAL" % name for name in capacityNames)
+
+runColumns = ["id", "created", "source", "model", "country", "price", "scenario", "weatherYears"] + capacityNames + ["objective"]
+
+
+def connect(path=defaultPath):
+    """Open (and create) the results database."""
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(_schema)
+    return db
+
+
+def add_run(db, model, country, price, scenario, values, objective, weatherYears=None, source=None, **info):
+    """Store a run: values are the solution blocks (model.split() output),
+    of which the capacities go to the runs table and the hourly arrays to
+    series. info is kept as JSON. Returns the id of the run."""
+    capacities = [values.get(name) for name in capacityNames]
+    with db:
+        cursor = db.execute(
+            "INSERT INTO runs (created, source, model, country, price, scenario, weatherYears, %s, objective, info) "
+            "VALUES (%s)" % (", ".join(capacityNames), ", ".join("?" * (len(capacityNames) + 9))),
+            [time.strftime("%Y-%m-%d %H:%M:%S"), source, model, country, _text(price), scenario or "Base",
+             _years(weatherYears)] + [None if value is None else float(value) for value in capacities]
+            + [None if objective is None else float(objective), json.dumps(info, default=str)])
+        run = cursor.lastrowid
+        db.executemany("INSERT INTO series (run, name, data) VALUES (?, ?, ?)",
+                       [(run, name, _pack(value)) for name, value in values.items() if np.ndim(value) > 0])
+    return run
+
+
+def find_runs(db, model=None, country=None, price=None, scenario=None, weatherYears=None):
+    """Runs matching the given columns, as dicts of the runs columns, in
+    the order they were stored."""
+    where = []
+    args = []
+    for column, value in (("model", model), ("country", country), ("price", _text(price)), ("scenario", scenario),
+                          ("weatherYears", _years(weatherYears))):
+        if value is not None:
+            where.append("%s = ?" % column)
+            args.append(value)
+    query = "SELECT %s FROM runs" % ", ".join(runColumns)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return [dict(zip(runColumns, row)) for row in db.execute(query + " ORDER BY id", args)]
+
+
+def load_series(db, run, names=None):
+    """Hourly series of a run by name, all of them or the given names."""
+    query = "SELECT name, data FROM series WHERE run = ?"
+    args = [run]
+    if names is not None:
+        query += " AND name IN (%s)" % ", ".join("?" * len(names))
+        args.extend(names)
+    return {name: _unpack(data) for name, data in db.execute(query, args)}
+
+
+def delete_runs(db, runs):
+    """Delete runs and their series."""
+    with db:
+        db.executemany("DELETE FROM runs WHERE id = ?", [(run,) for run in runs])
+
+
+#### IMPORT OF CSV RESULTS
+
+# output_PAP_FI_2020_22prices.csv, OLD_RESULTS/output_BASE_FI_2019.csv
+_outputName = re.compile(r"output_(PAP|BASE)_([A-Z]{2})_(\d{4})(?:_(\d{2})prices)?\.csv$")
+
+
+def import_output_csv(db, path, model=None, country=None, price=None, scenario=None, weatherYears=None):
+    """Store a Variable,Value output file. Model, country, weather year and
+    price are taken from an output_<model>_<country>_<year>[_<price>prices]
+    file name unless given. Returns the id of the run."""
+    match = _outputName.search(os.path.basename(path))
+    if match:
+        model = model or match.group(1)
+        country = country or match.group(2)
+        weatherYears = weatherYears or match.group(3)
+        price = price or match.group(4)
+    if model is None or country is None:
+        raise ValueError("Model and country of %s are not known" % path)
+
+    series = defaultdict(list)
+    values = {}
+    objective = None
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # Variable,Value
+        for name, value in reader:
+            if name == "Objective":
+                objective = float(value)
+            elif name.endswith("]"):
+                series[name[:name.index("[")]].append(float(value))
+            else:
+                values[name] = float(value)
+    for name, value in series.items():
+        values[name] = np.array(value)
+    return add_run(db, model, country, price, scenario, values, objective, weatherYears, source=os.path.relpath(path, dataDir))
+
+
+def import_sensitivity_csv(db, path, model, weatherYears=None):
+    """Store the rows of a sensitivity_PAP.csv or sensitivity_base.csv
+    file, capacities and objectives only, further columns (key figures) as
+    info. Returns the ids of the runs."""
+    runs = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            values = {name: float(row[name]) for name in capacityNames if row.get(name) not in (None, "")}
+            objective = float(row["Objective"]) if row.get("Objective") not in (None, "") else None
+            extra = {name: float(value) for name, value in row.items()
+                     if name not in capacityNames and name not in ("Country", "PAP Year", "Scenario", "Objective") and value}
+            runs.append(add_run(db, model, row["Country"], row["PAP Year"], row["Scenario"], values, objective,
+                                weatherYears, source=os.path.relpath(path, dataDir), **extra))
+    return runs
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _years(weatherYears):
+    if weatherYears is None or isinstance(weatherYears, str):
+        return weatherYears
+    if isinstance(weatherYears, int):
+        return str(weatherYears)
+    return ",".join(str(year) for year in weatherYears)
+
+
+def _pack(values):
+    return zlib.compress(np.ascontiguousarray(values, dtype="<f8").tobytes())
+
+
+def _unpack(data):
+    return np.frombuffer(zlib.decompress(data), dtype="<f8")
+
+
+if __name__ == "__main__":
+    # Import the result files of the repository that are not in the database yet
+    db = connect()
+    imported = {source for (source,) in db.execute("SELECT DISTINCT source FROM runs")}
+    for directory in (dataDir, os.path.join(dataDir, "OLD_RESULTS")):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, dataDir) in imported:
+                continue
+            if _outputName.search(name):
+                print("%s: run %d" % (name, import_output_csv(db, path)))
+    for name, model in (("sensitivity_PAP.csv", "PAP"), ("sensitivity_base.csv", "BASE")):
+        if name not in imported and os.path.exists(os.path.join(dataDir, name)):
+            print("%s: %d runs" % (name, len(import_sensitivity_csv(db, os.path.join(dataDir, name), model, "2020"))))
+    db.close()
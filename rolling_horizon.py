@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Rolling-horizon operation of a fixed design
+#
+# The design model optimises capacities and a whole year of dispatch in one
+# LP, whose solve time grows faster than its length. solve_rolling() only
+# operates a given design: it solves overlapping windows (two weeks, of which
+# the last two days are solved again by the next window), keeps the hours
+# before the overlap and hands the hydrogen storage and battery levels and
+# the hydrogen production of the last kept hour to the next window. Time and
+# memory grow linearly with the horizon, so several weather and price years
+# can be operated back to back.
+#
+# A window only sees two weeks ahead, so on its own it would empty a seasonal
+# hydrogen storage. storageTargets, e.g. HydrogenStored of the design solve or
+# representative_days.full_year() of a screening solve, gives the storage
+# level each window should leave behind at its last hour; every kg short of
+# it is charged shortfallCost in the window objective.
+#
+# Without foresight a window can run out of hydrogen that the design solve
+# would have kept in store. Demand may then go unmet at demandShortfallCost
+# per kg (build_pap demandShortfallCost), so every window has a dispatch;
+# the unmet demand is returned as the hourly series HydrogenShortfall.
+
+import numpy as np
+
+from model_builder import build_pap, capacityNames, pap_cost_terms
+from scenario_runner import ScenarioSolver
+
+
+def solve_rolling(params, windCF, solarCF, gridPrice, capacities, backend, windowHours=14 * 24, overlapHours=2 * 24,
+                  storageTargets=None, shortfallCost=1000.0, demandShortfallCost=100.0, reduce=True, startHour=0):
+    """Operate the design capacities ({"CapacityElec": ..., ...}) over the
+    whole series with a rolling horizon.
+
+    Returns (values, terms): the hourly dispatch of the horizon by variable
+    name (with the capacities and the unmet demand HydrogenShortfall, kg) and
+    the cost terms of the build_pap objective for it, without the unmet
+    demand. storageTargets are hourly hydrogen storage targets for the end of
+    every window but the last, shortfallCost the cost of a kg short of them,
+    demandShortfallCost the cost of a kg of demand not met and startHour is
+    the hour of the year of the first hour. Raises RuntimeError if the solver
+    returns no dispatch for a window.
+    """
+    if overlapHours >= windowHours:
+        raise ValueError("The overlap must be shorter than the window")
+    nHours = len(windCF)
+    solver = ScenarioSolver(backend, reduce=reduce)   # Windows of the same shape update the loaded model
+    values = {name: float(capacities[name]) for name in capacityNames}
+    state = None
+    start = 0
+    try:
+        while start < nHours:
+            stop = min(start + windowHours, nHours)
+            last = stop == nHours
+            endStorage = None if last or storageTargets is None else storageTargets[stop - 1]
+            model = build_pap(params, windCF[start:stop], solarCF[start:stop], gridPrice[start:stop],
+                              capacities=capacities, initialState=state, startHour=startHour + start, endCondition=last,
+                              endStorage=endStorage, shortfallCost=shortfallCost,
+                              demandShortfallCost=demandShortfallCost)
+            result = solver.solve(model)
+            if not result.optimal:
+                raise RuntimeError("No dispatch in the window of hours %d-%d: %s" % (start, stop, result.status))
+
+            # Keep the hours before the overlap, the last window keeps everything
+            keep = stop - start if last else windowHours - overlapHours
+            window = model.split(result.x)
+            if state is None:
+                # Hour 0 has no demand row
+                window["HydrogenShortfall"] = np.concatenate([[0.0], window["HydrogenShortfall"]])
+            for name, series in window.items():
+                if name in model.scalarVars:
+                    continue
+                if name not in values:
+                    values[name] = np.empty(nHours)
+                values[name][start:start + keep] = series[:keep]
+            state = {name: window[name][keep - 1] for name in ("HydrogenStored", "ElectricityStored", "HydrogenProd")}
+            start += keep
+    finally:
+        solver.dispose()
+    return values, pap_cost_terms(params, values, windCF, solarCF, gridPrice)
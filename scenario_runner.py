@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Sensitivity scenarios on one loaded solver model
+#
+# The sensitivity cases of a country and PAP price differ from each other only
+# in a few objective coefficients (CapexElec, OpexElec, RElec, the grid price
+# vector) and in the EfficiencyElec matrix coefficients. ScenarioSolver loads
+# the first scenario into the solver and turns it into every following
+# scenario in place with backend.update(), so a sweep pays the solver model
+# construction once per country and price instead of once per scenario.
+#
+# With warmStart the optimal basis of each solve is the starting basis of the
+# next one, re-solved with primal simplex: the basis of a scenario stays
+# feasible when only objective coefficients change. order_scenarios() chains
+# the scenarios so that each one follows its most similar predecessor.
+#
+# solve_all() goes one step further on backends with multi-scenario support:
+# the scenarios that only change objective coefficients, bounds or right-hand
+# sides (GridPrice, CapexElec and RElec cases) are solved together as one
+# multi-scenario model, the EfficiencyElec cases one by one.
+
+import numbers
+
+import numpy as np
+
+from model_reduction import reduce_model, no_reduction
+from solver_backends import expand_result
+
+
+class ScenarioSolver:
+    """Solves a sequence of LinearModels with one backend. A model with the
+    same structure as the loaded one is applied as an in-place update, any
+    other model is loaded from scratch.
+
+    warmStart starts every updated model from the basis of the previous solve
+    with warmMethod; the first solve of a structure uses the backend's method.
+    """
+
+    def __init__(self, backend, reduce=True, warmStart=False, warmMethod="primal"):
+        self.backend = backend
+        self.reduce = reduce
+        self.warmStart = warmStart
+        self.warmMethod = warmMethod
+        self.start = None
+        self.loads = 0
+        self.updates = 0
+
+    def solve(self, model):
+        """Solve model and return the SolverResult of the full model."""
+        return self._solve(model, *self._reduce(model))
+
+    def solve_all(self, models, multiScenario=True):
+        """Solve models and return their results in the same order. With
+        multiScenario, the models whose solver model differs from the first
+        one only in objective, bounds and right-hand sides are solved as one
+        multi-scenario model if the backend supports it."""
+        reduced = [self._reduce(model) for model in models]
+        results = [None] * len(models)
+        if multiScenario and self.backend.multiScenario and models:
+            base = reduced[0][0]
+            group = [i for i, (solveModel, _) in enumerate(reduced) if same_matrix(base, solveModel)]
+            if len(group) > 1:
+                solved = self.backend.solve_scenarios([reduced[i][0] for i in group])
+                self.loads += 1
+                self.start = None  # no basis from a multi-scenario solve
+                for i, result in zip(group, solved):
+                    results[i] = expand_result(result, models[i], reduced[i][1])
+                    reduced[i] = None
+        for i, model in enumerate(models):
+            if results[i] is None:
+                results[i] = self._solve(model, *reduced[i])
+                reduced[i] = None  # the backend keeps the loaded one
+        return results
+
+    def _reduce(self, model):
+        return reduce_model(model) if self.reduce else no_reduction(model)
+
+    def _solve(self, model, solveModel, postsolve):
+        loaded = self.backend.model
+        if loaded is not None and loaded.same_structure(solveModel):
+            self.backend.update(solveModel)
+            self.updates += 1
+            # The start belongs to the loaded model, i.e. to this structure
+            if self.warmStart and self.start is not None:
+                self.backend.warm_start(self.start, self.warmMethod)
+        else:
+            self.backend.load(solveModel)
+            self.loads += 1
+        result = self.backend.optimize()
+        if self.warmStart:
+            self.start = self.backend.start() if result.optimal else None
+        return expand_result(result, model, postsolve)
+
+    def dispose(self):
+        self.backend.dispose()
+        self.start = None
+
+
+def same_matrix(model, other):
+    """Whether model and other have the same constraint matrix, i.e. differ
+    only in objective, bounds and right-hand sides."""
+    if not model.same_structure(other):
+        return False
+    A, B = model.A.tocsr(), other.A.tocsr()
+    A.sort_indices()
+    B.sort_indices()
+    return np.array_equal(A.data, B.data)
+
+
+def order_scenarios(scenarios, params):
+    """Order scenarios for warm-started solves: starting from the first one,
+    always continue with the remaining scenario whose parameters (params, one
+    dict per scenario) are closest to the last one."""
+    remaining = list(range(1, len(scenarios)))
+    order = [0] if scenarios else []
+    while remaining:
+        last = params[order[-1]]
+        nearest = min(remaining, key=lambda i: scenario_distance(last, params[i]))
+        remaining.remove(nearest)
+        order.append(nearest)
+    return [scenarios[i] for i in order]
+
+
+def scenario_distance(p, q):
+    """Sum of the relative differences of the numeric parameters."""
+    distance = 0.0
+    for key, value in p.items():
+        other = q.get(key)
+        if isinstance(value, bool) or not isinstance(value, numbers.Number) or not isinstance(other, numbers.Number):
+            if value != other:
+                distance += 1.0
+            continue
+        scale = max(abs(value), abs(other))
+        if scale > 0:
+            distance += abs(value - other) / scale
+    return distance
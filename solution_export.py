@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Columnar export of model solutions
+#
+# The scripts used to write every variable of a solution as its own
+# "Variable,Value" row, 60k rows per year that are slow to write and to parse
+# again. save_solution() writes one .npz instead: every hourly series as a
+# column of an hour-indexed table, the capacities and the objective together
+# with the run information as JSON metadata. write_variable_csv() still
+# produces the old layout, with the rows written in one call.
+
+import csv
+import json
+import os
+
+import numpy as np
+
+
+def save_solution(path, values, objective, **info):
+    """Write the solution blocks values (model.split() output: floats for
+    the capacities, hourly arrays for the rest) and the objective to path.
+
+    info is stored with the metadata, e.g. country, price and scenario.
+    """
+    columns = {name: np.asarray(value, dtype=float) for name, value in values.items() if np.ndim(value) > 0}
+    nHours = {column.size for column in columns.values()}
+    if len(nHours) > 1:
+        raise ValueError("Hourly series of different lengths: %s" % sorted(nHours))
+    meta = dict(info)
+    meta["objective"] = float(objective) if objective is not None else None
+    meta["scalars"] = {name: float(value) for name, value in values.items() if np.ndim(value) == 0}
+    meta["columns"] = list(columns)
+    meta["blocks"] = list(values)  # model column order
+    meta["nHours"] = nHours.pop() if nHours else 0
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, _meta=json.dumps(meta), **columns)
+    os.replace(tmp, path)
+
+
+def load_solution(path):
+    """(values, objective, info) of a file written by save_solution(), with
+    values in the same form as model.split() returns them."""
+    with np.load(path) as data:
+        meta = json.loads(str(data["_meta"]))
+        columns = {name: data[name] for name in meta.pop("columns")}
+    scalars = meta.pop("scalars")
+    values = {name: scalars[name] if name in scalars else columns[name] for name in meta.pop("blocks")}
+    objective = meta.pop("objective")
+    meta.pop("nHours")
+    return values, objective, meta
+
+
+def write_variable_csv(path, values, objective):
+    """Write values and the objective in the Variable,Value layout of the
+    old output_*.csv files: one row per variable, HydrogenProd[0] etc."""
+    rows = []
+    for name, value in values.items():
+        if np.ndim(value) == 0:
+            rows.append((name, float(value)))
+        else:
+            rows.extend(zip(["%s[%d]" % (name, i) for i in range(np.size(value))], np.asarray(value, dtype=float).tolist()))
+    with open(path, mode='w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['Variable', 'Value'])
+        writer.writerows(rows)
+        writer.writerow(['Objective', objective])
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+# Solver backends for model_builder.LinearModel
+#
+# GurobiBackend emits the model with to_gurobi() and HighsBackend hands the
+# same sparse constraint matrix to SciPy's HiGHS interface, so PAP and BASE
+# runs do not need a Gurobi licence. Both return a SolverResult with the
+# primal solution, row duals and reduced costs in the model's column and
+# row order.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from model_reduction import reduce_model, no_reduction
+from solver_settings import LP, configure_solver, methods
+
+OPTIMAL = "OPTIMAL"
+INFEASIBLE = "INFEASIBLE"
+UNBOUNDED = "UNBOUNDED"
+OTHER = "OTHER"
+
+
+class SolverResult:
+    """Outcome of one solve. x, duals and reducedCosts are None when the
+    solver did not return a solution. stats holds further solver figures by
+    name and progress the samples of a backend with progress=True."""
+
+    def __init__(self, status, objective=None, x=None, duals=None, reducedCosts=None,
+                 runtime=0.0, iterations=0, backend=None, modelClass=LP, stats=None, progress=None):
+        self.status = status
+        self.objective = objective
+        self.x = x
+        self.duals = duals
+        self.reducedCosts = reducedCosts
+        self.runtime = runtime
+        self.iterations = iterations
+        self.backend = backend
+        self.modelClass = modelClass
+        self.stats = stats or {}
+        self.progress = progress or []
+
+    @property
+    def optimal(self):
+        return self.status == OPTIMAL
+
+
+class GurobiBackend:
+    """Solve with gurobipy. modelClass and method are passed to
+    solver_settings.configure_solver(), params are set as Gurobi parameters
+    and threads limits the solver threads (Threads). With progress, a
+    callback samples the iteration count, objective and bound of every
+    solver phase at most every progressInterval seconds into
+    SolverResult.progress."""
+
+    name = "gurobi"
+    multiScenario = True
+
+    def __init__(self, modelClass=None, method=None, params=None, env=None, threads=None, progress=False,
+                 progressInterval=0.5):
+        self.requestedClass = modelClass
+        self.modelClass = modelClass
+        self.method = method
+        self.params = dict(params or {})
+        if threads is not None:
+            self.params["Threads"] = threads
+        self.env = env
+        self.progress = progress
+        self.progressInterval = progressInterval
+        self.m = None
+        self.model = None
+
+    def load(self, model):
+        import gurobipy as gp
+        from model_builder import to_gurobi
+
+        self.dispose()
+        self.model = model
+        self.m = gp.Model(model.name, env=self.env)
+        self.x, self.constrs = to_gurobi(model, self.m)
+        for name, value in self.params.items():
+            self.m.setParam(name, value)
+        # Every loaded model is classified again unless the class was given
+        self.modelClass = configure_solver(self.m, self.requestedClass, self.method)
+        self.m.update()
+        self.vars = self.m.getVars()
+        self.rows = self.m.getConstrs()
+
+    def update(self, model):
+        """Change the loaded model into model in place. model must have the
+        same structure (LinearModel.same_structure), only objective and matrix
+        coefficients, bounds and right-hand sides that differ are set."""
+        old = self.model
+        m = self.m
+        for attr, new, prev, items in (("Obj", model.c, old.c, self.vars), ("LB", model.lb, old.lb, self.vars),
+                                       ("UB", model.ub, old.ub, self.vars), ("RHS", model.rhs, old.rhs, self.rows)):
+            changed = np.flatnonzero(new != prev)
+            if changed.size:
+                m.setAttr(attr, [items[i] for i in changed], new[changed].tolist())
+        if model.objConstant != old.objConstant:
+            m.ObjCon = model.objConstant
+
+        A, B = model.A.tocsr(), old.A.tocsr()
+        A.sort_indices()
+        B.sort_indices()
+        changed = np.flatnonzero(A.data != B.data)
+        rowOf = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+        for i, j, value in zip(rowOf[changed], A.indices[changed], A.data[changed]):
+            m.chgCoeff(self.rows[i], self.vars[j], value)
+        self.model = model
+
+    def optimize(self):
+        from gurobipy import GRB
+
+        m = self.m
+        progress = self._optimize()
+        status = {GRB.OPTIMAL: OPTIMAL, GRB.INFEASIBLE: INFEASIBLE, GRB.UNBOUNDED: UNBOUNDED}.get(m.Status, OTHER)
+        result = SolverResult(status, runtime=m.Runtime, iterations=int(m.IterCount + m.BarIterCount),
+                              backend=self.name, modelClass=self.modelClass, stats=self._stats(), progress=progress)
+        if m.SolCount > 0:
+            result.objective = m.ObjVal
+            result.x = np.array(m.getAttr("X", m.getVars()))
+            if self.modelClass != "NONCONVEX" and m.Status == GRB.OPTIMAL:
+                result.duals = np.array(m.getAttr("Pi", m.getConstrs()))
+                result.reducedCosts = np.array(m.getAttr("RC", m.getVars()))
+        return result
+
+    def solve_scenarios(self, models):
+        """Solve models that differ from models[0] only in their objective,
+        bounds and right-hand sides as the scenarios of one multi-scenario
+        model (NumScenarios), so build and presolve are paid once. Returns one
+        SolverResult per model, without duals.
+
+        Gurobi solves multi-scenario models by branch and bound, whose
+        default MIPGap would stop the scenarios short of their LP optimum, so
+        the gaps are zero unless params set them. The status of every result
+        comes from the objective and bound of its own scenario."""
+        from gurobipy import GRB
+
+        base = models[0]
+        self.load(base)
+        m = self.m
+        for name in ("MIPGap", "MIPGapAbs"):
+            if name not in self.params:
+                m.setParam(name, 0.0)
+        m.NumScenarios = len(models)
+        for k, model in enumerate(models):
+            m.Params.ScenarioNumber = k
+            for attr, new, prev, items in (("ScenNObj", model.c, base.c, self.vars), ("ScenNLB", model.lb, base.lb, self.vars),
+                                           ("ScenNUB", model.ub, base.ub, self.vars), ("ScenNRHS", model.rhs, base.rhs, self.rows)):
+                changed = np.flatnonzero(new != prev)
+                if changed.size:
+                    m.setAttr(attr, [items[i] for i in changed], new[changed].tolist())
+        progress = self._optimize()
+        stats = self._stats()
+
+        results = []
+        for k, model in enumerate(models):
+            m.Params.ScenarioNumber = k
+            result = SolverResult(OTHER, runtime=m.Runtime, iterations=int(m.IterCount + m.BarIterCount),
+                                  backend=self.name, modelClass=self.modelClass, stats=stats, progress=progress)
+            objective, bound = m.ScenNObjVal, m.ScenNObjBound
+            if m.SolCount > 0 and abs(objective) < GRB.INFINITY:
+                # An optimal model has every scenario within the gaps
+                gap = objective - bound
+                proven = gap <= m.Params.MIPGapAbs or gap <= m.Params.MIPGap * abs(objective)
+                result.status = OPTIMAL if m.Status == GRB.OPTIMAL or proven else OTHER
+                # The scenarios share ObjCon
+                result.objective = objective + model.objConstant - base.objConstant
+                result.x = np.array(m.getAttr("ScenNX", self.vars))
+            elif bound >= GRB.INFINITY:
+                result.status = INFEASIBLE  # No point of this scenario and none can exist
+            results.append(result)
+        m.NumScenarios = 0
+        return results
+
+    def _optimize(self):
+        """m.optimize(), with the progress callback if asked for. Returns the
+        progress samples."""
+        if not self.progress:
+            self.m.optimize()
+            return []
+        samples = []
+        callback = _progress_callback(samples, self.progressInterval)
+        self.m.optimize(callback)
+        callback.flush()
+        return samples
+
+    def _stats(self):
+        m = self.m
+        stats = dict(simplexIterations=int(m.IterCount), barrierIterations=int(m.BarIterCount),
+                     solverRows=m.NumConstrs, solverCols=m.NumVars, solverNonzeros=m.NumNZs)
+        try:
+            stats["work"] = m.Work
+        except AttributeError:  # Gurobi before 9.5
+            pass
+        return stats
+
+    def start(self):
+        """Optimal basis of the last solve as (VBasis, CBasis), or None."""
+        import gurobipy as gp
+
+        try:
+            return self.m.getAttr("VBasis", self.vars), self.m.getAttr("CBasis", self.rows)
+        except gp.GurobiError:
+            return None  # no basis, e.g. barrier without crossover
+
+    # Sensitivity attributes of an objective coefficient, right-hand side or bound
+    rangingAttrs = {"c": ("SAObjLow", "SAObjUp"), "rhs": ("SARHSLow", "SARHSUp"),
+                    "lb": ("SALBLow", "SALBUp"), "ub": ("SAUBLow", "SAUBUp")}
+
+    def ranging(self, attr, index):
+        """(low, up) of the objective coefficient ("c"), right-hand side
+        ("rhs") or bound ("lb", "ub") of column or row index of the loaded
+        model within which the optimal basis of the last solve stays
+        optimal. None when the last solve left no basis."""
+        import gurobipy as gp
+
+        low, up = self.rangingAttrs[attr]
+        item = self.rows[index] if attr == "rhs" else self.vars[index]
+        try:
+            return item.getAttr(low), item.getAttr(up)
+        except gp.GurobiError:
+            return None
+
+    def warm_start(self, start, method="primal"):
+        """Start the next solve from a basis of start() with a simplex method.
+        Barrier ignores a starting basis."""
+        vbasis, cbasis = start
+        self.m.setAttr("VBasis", self.vars, vbasis)
+        self.m.setAttr("CBasis", self.rows, cbasis)
+        self.m.Params.Method = methods[method] if isinstance(method, str) else method
+
+    def solve(self, model):
+        self.load(model)
+        return self.optimize()
+
+    def dispose(self):
+        if self.m is not None:
+            self.m.dispose()
+            self.m = None
+        self.model = None
+
+
+def _progress_callback(samples, interval):
+    """Gurobi callback that appends (time, phase, iterations, objective,
+    bound) samples to samples: the first and last of every phase and one per
+    interval seconds in between. Simplex after barrier is crossover."""
+    from gurobipy import GRB
+
+    cb = GRB.Callback
+    state = {"phase": None, "last": None, "sample": None, "barrier": False}
+
+    def callback(model, where):
+        if where == cb.PRESOLVE:
+            phase, iterations, objective, bound = "presolve", 0, None, None
+        elif where == cb.BARRIER:
+            state["barrier"] = True
+            phase = "barrier"
+            iterations = model.cbGet(cb.BARRIER_ITRCNT)
+            objective, bound = model.cbGet(cb.BARRIER_PRIMOBJ), model.cbGet(cb.BARRIER_DUALOBJ)
+        elif where == cb.SIMPLEX:
+            phase = "crossover" if state["barrier"] else "simplex"
+            iterations, objective, bound = model.cbGet(cb.SPX_ITRCNT), model.cbGet(cb.SPX_OBJVAL), None
+        elif where == cb.MIP:
+            phase = "mip"
+            iterations = model.cbGet(cb.MIP_ITRCNT)
+            objective, bound = model.cbGet(cb.MIP_OBJBST), model.cbGet(cb.MIP_OBJBND)
+        else:
+            return
+        runtime = model.cbGet(cb.RUNTIME)
+        sample = dict(time=round(runtime, 4), phase=phase, iterations=int(iterations), objective=objective, bound=bound)
+        if phase != state["phase"]:
+            if state["sample"] is not None and state["sample"] is not state["last"]:
+                samples.append(state["sample"])  # last sample of the previous phase
+            samples.append(sample)
+            state["phase"] = phase
+            state["last"] = sample
+        elif runtime - state["last"]["time"] >= interval:
+            samples.append(sample)
+            state["last"] = sample
+        state["sample"] = sample
+
+    def flush():
+        if state["sample"] is not None and state["sample"] is not state["last"]:
+            samples.append(state["sample"])
+
+    callback.flush = flush
+    return callback
+
+
+class HighsBackend:
+    """Solve with HiGHS through scipy.optimize.linprog. method picks the HiGHS
+    algorithm like Gurobi's Method: "barrier" is the interior point solver,
+    "primal"/"dual" the dual simplex and anything else lets HiGHS choose."""
+
+    name = "highs"
+    multiScenario = False
+    methods = {"barrier": "highs-ipm", "primal": "highs-ds", "dual": "highs-ds"}
+
+    def __init__(self, modelClass=None, method=None, params=None, threads=None, progress=False, progressInterval=None):
+        # threads and progress are accepted for symmetry: linprog has no
+        # thread option, its HiGHS build solves single threaded, and it takes
+        # no callback, so there are no progress samples
+        if modelClass not in (None, LP):
+            raise ValueError("The HiGHS backend only solves linear models")
+        self.modelClass = LP
+        self.method = self.methods.get(method, "highs")
+        self.params = params or {}
+        self.model = None
+
+    def load(self, model):
+        # linprog takes A_ub @ x <= b_ub and A_eq @ x == b_eq, so >= rows are negated
+        self.model = model
+        sense = model.sense
+        self.le = np.flatnonzero(sense != "=")
+        self.eq = np.flatnonzero(sense == "=")
+        sign = np.where(sense[self.le] == ">", -1.0, 1.0)
+        self.sign = sign
+        self.A_ub = (sp.diags(sign) @ model.A[self.le]).tocsr()
+        self.b_ub = sign * model.rhs[self.le]
+        self.A_eq = model.A[self.eq]
+        self.b_eq = model.rhs[self.eq]
+
+    def optimize(self):
+        from scipy.optimize import linprog
+
+        model = self.model
+        start = time.perf_counter()
+        res = linprog(model.c, A_ub=self.A_ub, b_ub=self.b_ub, A_eq=self.A_eq, b_eq=self.b_eq,
+                      bounds=np.column_stack([model.lb, model.ub]), method=self.method, options=self.params)
+        runtime = time.perf_counter() - start
+        status = {0: OPTIMAL, 2: INFEASIBLE, 3: UNBOUNDED}.get(res.status, OTHER)
+        stats = dict(solverRows=model.numConstrs, solverCols=model.numVars, solverNonzeros=int(model.A.nnz))
+        if res.get("crossover_nit") is not None:
+            stats["crossoverIterations"] = int(res.crossover_nit)
+        result = SolverResult(status, runtime=runtime, iterations=int(res.get("nit", 0) or 0), backend=self.name,
+                              stats=stats)
+        if res.x is not None and res.status == 0:
+            result.objective = res.fun + model.objConstant
+            result.x = res.x
+            # Marginals are d objective / d rhs like Gurobi's Pi
+            duals = np.zeros(model.numConstrs)
+            duals[self.le] = self.sign * res.ineqlin.marginals
+            duals[self.eq] = res.eqlin.marginals
+            result.duals = duals
+            result.reducedCosts = res.lower.marginals + res.upper.marginals
+        return result
+
+    def update(self, model):
+        # linprog gets the whole problem on every call anyway
+        self.load(model)
+
+    # scipy's HiGHS interface takes no starting basis, every solve is cold
+
+    def start(self):
+        return None
+
+    def warm_start(self, start, method="primal"):
+        pass
+
+    def ranging(self, attr, index):
+        return None  # linprog does not return sensitivity ranges
+
+    def solve(self, model):
+        self.load(model)
+        return self.optimize()
+
+    def dispose(self):
+        self.model = None
+
+
+backends = {
+    GurobiBackend.name: GurobiBackend,
+    HighsBackend.name: HighsBackend,
+}
+
+
+def make_backend(name="gurobi", **options):
+    """Backend by name ("gurobi" or "highs")."""
+    if name not in backends:
+        raise ValueError("Unknown solver backend: " + str(name))
+    return backends[name](**options)
+
+
+def out_of_memory(error):
+    """Whether error is a solve running out of memory: MemoryError, or
+    Gurobi's OUT_OF_MEMORY error (10001) past its MemLimit."""
+    return isinstance(error, MemoryError) or getattr(error, "errno", None) == 10001
+
+
+def solve_model(model, backend, reduce=True, log=None):
+    """Solve a LinearModel, optionally reduced first, and return the
+    SolverResult in terms of the full model. Duals of removed rows and
+    reduced costs of removed columns are NaN.
+
+    With an instrumentation.RunLog log, the reduce, load and solve phases,
+    the model sizes and the solver figures are recorded in it.
+    """
+    if log is None:
+        solveModel, postsolve = reduce_model(model) if reduce else no_reduction(model)
+        return expand_result(backend.solve(solveModel), model, postsolve)
+    log.model("built", model)
+    with log.phase("reduce"):
+        solveModel, postsolve = reduce_model(model) if reduce else no_reduction(model)
+    log.model("solved", solveModel)
+    with log.phase("load"):
+        backend.load(solveModel)
+    with log.phase("solve"):
+        result = backend.optimize()
+    log.solver(result)
+    return expand_result(result, model, postsolve)
+
+
+def expand_result(result, model, postsolve):
+    """Map a SolverResult of a reduced model back to the full model."""
+    if result.x is not None:
+        result.x = postsolve.expand(result.x)
+    if result.duals is not None:
+        duals = np.full(model.numConstrs, np.nan)
+        duals[postsolve.rowIndex] = result.duals
+        result.duals = duals
+    if result.reducedCosts is not None:
+        reducedCosts = np.full(model.numVars, np.nan)
+        reducedCosts[postsolve.colIndex] = result.reducedCosts
+        result.reducedCosts = reducedCosts
+    return result
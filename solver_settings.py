@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Model classification and solver settings
+#
+# The scripts used to set m.Params.NonConvex = 2 unconditionally although
+# the PAP and BASE models are linear: WindProd[h] == CapacityWind *
+# CapFactorWind[h] multiplies a variable by data, not by another variable.
+# classify_model() inspects a built model and configure_solver() picks the
+# solver mode and algorithm for its class.
+
+import numpy as np
+
+# Model classes
+LP = "LP"
+CONVEX_QP = "QP"
+NONCONVEX = "NONCONVEX"
+
+# Gurobi Method parameter values
+methods = {
+    "auto": -1,
+    "primal": 0,
+    "dual": 1,
+    "barrier": 2,
+    "concurrent": 3,
+    "deterministic-concurrent": 4,
+}
+
+# Algorithm used for each class unless the caller asks for another one.
+# Barrier is the fastest method for the yearly storage LPs.
+defaultMethods = {
+    LP: "barrier",
+    CONVEX_QP: "barrier",
+    NONCONVEX: "auto",
+}
+
+
+def classify_model(m, tol=1e-9):
+    """Classify the gurobipy Model m as LP, QP (convex quadratic objective or
+    convex quadratic constraints) or NONCONVEX.
+
+    Integer variables and general constraints are classified NONCONVEX, so the
+    solver keeps its full nonconvex machinery for them.
+    """
+    m.update()
+    if m.NumIntVars > 0 or m.NumGenConstrs > 0:
+        return NONCONVEX
+    if m.NumQNZs == 0 and m.NumQConstrs == 0:
+        return LP
+
+    # A minimized objective x'Qx needs Q positive semidefinite, a maximized one
+    # negative semidefinite
+    if m.NumQNZs > 0:
+        Q = m.getQ()
+        if m.ModelSense < 0:
+            Q = -Q
+        if not _is_psd(Q, tol):
+            return NONCONVEX
+
+    # x'Qx + q'x <= rhs is convex for PSD Q, x'Qx + q'x >= rhs for NSD Q and
+    # quadratic equalities never are
+    for qc in m.getQConstrs():
+        Q = m.getQCMatrices(qc)[0]
+        if qc.QCSense == "=":
+            return NONCONVEX
+        if not _is_psd(Q if qc.QCSense == "<" else -Q, tol):
+            return NONCONVEX
+    return CONVEX_QP
+
+
+def configure_solver(m, modelClass=None, method=None):
+    """Set the solver mode and algorithm of m for its model class.
+
+    modelClass overrides the detected class (LP, QP or NONCONVEX) and method
+    overrides the algorithm (a key of methods or a Gurobi Method value).
+    Returns the model class used.
+    """
+    if modelClass is None:
+        modelClass = classify_model(m)
+    if modelClass not in defaultMethods:
+        raise ValueError("Unknown model class: " + str(modelClass))
+    if method is None:
+        method = defaultMethods[modelClass]
+    if isinstance(method, str):
+        method = methods[method]
+
+    # NonConvex, quadratic equity constraints
+    m.Params.NonConvex = 2 if modelClass == NONCONVEX else -1
+    m.Params.Method = method
+    return modelClass
+
+
+def _is_psd(Q, tol):
+    """Whether the quadratic form x'Qx is convex."""
+    Q = Q.tocsr()
+    Q = (Q + Q.T) * 0.5
+    # Only variables that appear in the quadratic terms matter
+    used = np.unique(Q.nonzero()[0])
+    if used.size == 0:
+        return True
+    Q = Q[used][:, used]
+    scale = max(abs(Q).max(), 1.0)
+    if used.size <= 2000:
+        return np.linalg.eigvalsh(Q.toarray()).min() >= -tol * scale
+    from scipy.sparse.linalg import eigsh
+    return eigsh(Q, k=1, which="SA", return_eigenvectors=False)[0] >= -tol * scale
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+# Sensitivity sweeps over countries, PAP prices and scenarios
+#
+# run_sweep() hands the jobs of a sweep to a pool of worker processes. Every
+# worker keeps one ScenarioSolver, so consecutive jobs with the same model
+# structure still update the loaded solver model in place, and gets
+# cores // workers solver threads so that the pool as a whole uses the
+# host's cores once. Result rows are appended to the CSV file as soon as
+# their job finishes, together with the wall time of every scenario. With
+# cache, scenarios solved before with the same inputs are read from
+# result_cache instead of being solved again. With database, every row is
+# also stored as a run of the results database (results_db). The key figures
+# of kpis (LCOH, utilisation, sales, cycling) follow the objective in every
+# row, computed for the scenarios of a job in one batch. With runLog, every
+# job and the sweep as a whole append their instrumentation record (phase
+# times, model sizes, solver progress) to that file; the workers hand their
+# records to the parent process, which writes all lines.
+#
+# Memory stays flat over long sweeps: the job's models are released when the
+# job ends, a worker's Gurobi models all live in one environment that is
+# disposed with the worker, and with memoryLimitMB a worker's heap is capped
+# (RLIMIT_DATA, Gurobi's MemLimit). A scenario that does not fit under the
+# cap fails on its own with a NaN row while the worker goes on with the next
+# job. jobsPerWorker replaces worker processes after that many jobs, which
+# hands any fragmented heap back to the operating system.
+
+import csv
+import gc
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from input_data import defaultYear, load_country
+from parameters import nHoursYear, pap_parameters, base_parameters
+from model_builder import build_pap, build_base
+from solver_backends import OTHER, SolverResult, make_backend, out_of_memory
+from scenario_runner import ScenarioSolver, order_scenarios
+from result_cache import scenario_key, load_result, save_result
+from kpis import kpiColumns, batch_kpis
+import results_db
+from instrumentation import RunLog, write_record
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Columns of sensitivity_PAP.csv and sensitivity_base.csv
+headers = {
+    "PAP": ['Country', 'PAP Year', 'Scenario', 'CapacityElec', 'CapacitySolar', 'CapacityWind', 'CapacityBattery', 'CapacityStorage', 'Objective'],
+    "BASE": ['Country', 'PAP Year', 'Scenario', 'CapacityElec', 'CapacitySolar', 'CapacityWind', 'CapacityStorage', 'Objective'],
+}
+
+
+def sweep_jobs(countries, prices, scenarios, group=True):
+    """Jobs (country, price, scenarios) of a sweep. With group all scenarios
+    of a country and price are one job, solved with warm starts and
+    multi-scenario solves, otherwise every scenario is its own job."""
+    jobs = []
+    for country in countries:
+        for price in prices:
+            if group:
+                jobs.append((country, price, tuple(scenarios)))
+            else:
+                jobs.extend((country, price, (scenario,)) for scenario in scenarios)
+    return jobs
+
+
+def scenario_parameters(kind, country, price, scenario):
+    """Parameters of a PAP or BASE scenario."""
+    if kind == "PAP":
+        return pap_parameters(country, price, scenario)
+    return base_parameters(country, price, scenario)
+
+
+def input_series(kind, country):
+    """Hourly input series of a PAP or BASE model of country."""
+    if kind == "PAP":
+        return load_country(country)
+    return ()  # BASE runs on the DeliveryHours profiles only
+
+
+def build_models(kind, series, params):
+    """PAP or BASE models on the input series, one per parameter dict."""
+    if kind == "PAP":
+        windRaw, solarRaw, priceRaw = series
+        return [build_pap(p, windRaw, solarRaw, priceRaw) for p in params]
+    return [build_base(p, nHoursYear) for p in params]
+
+
+def result_row(kind, country, price, scenario, values, objective, kpis):
+    """CSV row of one scenario from its solution blocks values and key
+    figures kpis."""
+    return ([country, price, scenario] + [values[name] for name in headers[kind][3:-1]] + [objective]
+            + [kpis[name] for name in kpiColumns[kind]])
+
+
+def run_sweep(kind, jobs, output, workers=1, threads=None, backend="gurobi", modelClass=None, method=None,
+              reduce=True, warmStart=True, multiScenario=True, cache=True, database=None, runLog=None,
+              memoryLimitMB=None, jobsPerWorker=None):
+    """Solve the jobs of a PAP or BASE sweep and write the rows to output.
+
+    workers is the number of worker processes, 1 solves in this process.
+    threads is the solver thread budget of a worker, by default the cores
+    of the host divided by workers. Rows are written in the order the jobs
+    finish, and stored in the results database file database if given.
+    Instrumentation records go to the JSON lines file runLog if given.
+    memoryLimitMB is the memory ceiling of a worker, jobsPerWorker the
+    number of jobs after which a worker process is replaced (Python 3.11+).
+    Returns the rows and the timing (country, price, scenario, solve time,
+    job wall time, cached) of every scenario.
+    """
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    settings = (backend, dict(modelClass=modelClass, method=method, threads=threads, progress=bool(runLog)), reduce,
+                warmStart, multiScenario, cache, memoryLimitMB)
+    log = RunLog(runLog, "sweep", model=kind, output=output, jobs=len(jobs), workers=workers, threads=threads,
+                 backend=backend, method=method, reduce=reduce, warmStart=warmStart, multiScenario=multiScenario,
+                 memoryLimitMB=memoryLimitMB, jobsPerWorker=jobsPerWorker)
+
+    rows = []
+    timings = []
+    db = results_db.connect(database) if database else None
+    with open(output, mode='w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(headers[kind] + kpiColumns[kind])
+        output_file.flush()
+
+        def collect(jobRows, jobTimings, jobRecord):
+            if runLog:
+                write_record(runLog, dict(jobRecord, output=output))
+            with log.phase("collect"):  # CSV rows and results database
+                writer.writerows(jobRows)
+                output_file.flush()
+                rows.extend(jobRows)
+                timings.extend(jobTimings)
+                if db is not None:
+                    nColumns = len(headers[kind])
+                    for row in jobRows:
+                        country, price, scenario = row[:3]
+                        values = dict(zip(headers[kind][3:-1], row[3:nColumns - 1]))
+                        kpis = dict(zip(kpiColumns[kind], row[nColumns:]))
+                        results_db.add_run(db, kind, country, price, scenario, values, row[nColumns - 1], defaultYear,
+                                           source=output, **kpis)
+                for country, price, scenario, solveTime, wallTime, cached in jobTimings:
+                    if cached:
+                        print("%s %s %s %s: cached" % (kind, country, price, scenario))
+                    else:
+                        print("%s %s %s %s: solve %.2f s, job %.2f s" % (kind, country, price, scenario, solveTime, wallTime))
+
+        if workers <= 1:
+            limits = _limit_memory(memoryLimitMB)
+            _init_worker(*settings)
+            try:
+                for job in jobs:
+                    collect(*_run_job(kind, job))
+            finally:
+                _release_worker()
+                if limits is not None:
+                    resource.setrlimit(resource.RLIMIT_DATA, limits)
+        else:
+            poolOptions = dict(max_tasks_per_child=jobsPerWorker) if jobsPerWorker else {}
+            with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=settings, **poolOptions) as pool:
+                futures = [pool.submit(_run_job, kind, job) for job in jobs]
+                for future in as_completed(futures):
+                    collect(*future.result())
+    if db is not None:
+        db.close()
+    log.set(scenarios=len(timings), cached=sum(1 for timing in timings if timing[5]))
+    log.write()
+    return rows, timings
+
+
+#### WORKER
+
+_solver = None
+_env = None
+_multiScenario = True
+_cache = True
+
+
+def _start_worker(*settings):
+    # Pool processes exit through os._exit, so the solver is released by a
+    # multiprocessing finalizer rather than atexit
+    from multiprocessing.util import Finalize
+
+    _limit_memory(settings[-1])
+    _init_worker(*settings)
+    Finalize(None, _release_worker, exitpriority=10)
+
+
+def _init_worker(backend, options, reduce, warmStart, multiScenario, cache, memoryLimitMB):
+    global _solver, _env, _multiScenario, _cache
+    if backend == "gurobi":
+        import gurobipy as gp
+
+        # One environment for every model of the worker. Past MemLimit a
+        # solve fails with OUT_OF_MEMORY instead of the host swapping.
+        _env = gp.Env(params={"MemLimit": memoryLimitMB / 1024.0} if memoryLimitMB else {})
+        options = dict(options, env=_env)
+    _solver = ScenarioSolver(make_backend(backend, **options), reduce=reduce, warmStart=warmStart)
+    _multiScenario = multiScenario
+    _cache = cache
+
+
+def _release_worker():
+    global _solver, _env
+    if _solver is not None:
+        _solver.dispose()
+        _solver = None
+    if _env is not None:
+        _env.dispose()
+        _env = None
+    gc.collect()
+
+
+def _limit_memory(megabytes):
+    """Cap the heap of this process at megabytes. Returns the previous
+    limits, None if nothing was changed."""
+    if not megabytes or resource is None:
+        return None
+    limits = resource.getrlimit(resource.RLIMIT_DATA)
+    ceiling = int(megabytes * 1024 * 1024)
+    if limits[1] != resource.RLIM_INFINITY:
+        ceiling = min(ceiling, limits[1])
+    resource.setrlimit(resource.RLIMIT_DATA, (ceiling, limits[1]))
+    return limits
+
+
+def _run_job(kind, job):
+    country, price, scenarios = job
+    log = RunLog(None, "sweep job", model=kind, country=country, price=price, scenarios=list(scenarios))
+    start = time.perf_counter()
+    with log.phase("read"):
+        series = input_series(kind, country)
+    params = {scenario: scenario_parameters(kind, country, price, scenario) for scenario in scenarios}
+    cached = {}
+    with log.phase("cache"):
+        keys = {scenario: scenario_key(kind, params[scenario], series) for scenario in scenarios}
+        if _cache:
+            for scenario in scenarios:
+                found = load_result(keys[scenario])
+                if found is not None:
+                    cached[scenario] = found
+
+    # Most similar scenarios one after another for the warm starts
+    toSolve = [scenario for scenario in scenarios if scenario not in cached]
+    toSolve = order_scenarios(toSolve, [params[scenario] for scenario in toSolve])
+    loads, updates = _solver.loads, _solver.updates
+    try:
+        with log.phase("build"):
+            models = build_models(kind, series, [params[scenario] for scenario in toSolve])
+        if models:
+            log.model("built", models[0])
+        with log.phase("solve"):  # reduce, load or update and solve
+            results = _solver.solve_all(models, multiScenario=_multiScenario)
+    except Exception as error:
+        if not out_of_memory(error):
+            raise
+        # Drop the loaded model, the worker goes on with the next job
+        models = [None] * len(toSolve)
+        _solver.dispose()
+        gc.collect()
+        results = [SolverResult(OTHER, backend=_solver.backend.name) for scenario in toSolve]
+        log.set(error="out of memory")
+        print("%s %s %s: out of memory" % (kind, country, price))
+    solved = dict(zip(toSolve, zip(models, results)))
+    for scenario in toSolve:
+        log.solver(solved[scenario][1], scenario=scenario)
+    log.set(loads=_solver.loads - loads, updates=_solver.updates - updates, cached=list(cached))
+    wallTime = time.perf_counter() - start
+
+    outcomes = {}
+    jobTimings = []
+    for scenario in scenarios:
+        if scenario in cached:
+            outcomes[scenario] = cached[scenario]
+            jobTimings.append((country, price, scenario, 0.0, wallTime, True))
+        else:
+            model, result = solved[scenario]
+            values = None
+            if result.x is not None:
+                values = model.split(result.x)
+                if _cache and result.optimal:
+                    save_result(keys[scenario], values, result.objective)
+            outcomes[scenario] = (values, result.objective)
+            jobTimings.append((country, price, scenario, result.runtime, wallTime, False))
+    # Only the loaded solver model outlives the job
+    del models, results, solved
+    gc.collect()
+
+    # Key figures of all scenarios with a solution at once
+    withValues = [scenario for scenario in scenarios if outcomes[scenario][0] is not None]
+    kpis = {scenario: dict.fromkeys(kpiColumns[kind], np.nan) for scenario in scenarios}
+    if withValues:
+        gridPrice = series[2] if kind == "PAP" else None
+        with log.phase("kpis"):
+            figures = batch_kpis(kind, [params[scenario] for scenario in withValues],
+                                 [outcomes[scenario][0] for scenario in withValues],
+                                 [outcomes[scenario][1] for scenario in withValues], gridPrice)
+        for i, scenario in enumerate(withValues):
+            kpis[scenario] = {name: float(figures[name][i]) for name in kpiColumns[kind]}
+
+    jobRows = []
+    for scenario in scenarios:
+        values, objective = outcomes[scenario]
+        if values is None:
+            values = dict.fromkeys(headers[kind][3:-1], np.nan)
+        jobRows.append(result_row(kind, country, price, scenario, values, objective, kpis[scenario]))
+    return jobRows, jobTimings, log.record()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_data import load_country
+
+
+def pytest_addoption(parser):
+    parser.addoption("--full-year", action="store_true",
+                     help="Also solve the full-year models (about a minute with HiGHS)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "full_year: solves models of all 8784 hours")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--full-year"):
+        return
+    skip = pytest.mark.skip(reason="needs --full-year")
+    for item in items:
+        if item.get_closest_marker("full_year"):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def series():
+    """(windRaw, solarRaw, priceRaw) of a country cut to its first nHours."""
+    def cut(country, nHours=None):
+        return tuple(np.asarray(values)[:nHours] for values in load_country(country))
+    return cut
@@ -0,0 +1,52 @@
+import csv
+import os
+
+import pytest
+
+from input_data import dataDir
+from parameters import pap_parameters, base_parameters
+from model_builder import build_pap, build_base
+from solver_backends import make_backend, solve_model
+
+
+def stored_objective(model, country, price):
+    """Objective row of the output_*_2020_*prices.csv files written by the
+    original Gurobi scripts."""
+    with open(os.path.join(dataDir, "output_%s_%s_2020_%sprices.csv" % (model, country, price))) as f:
+        for name, value in csv.reader(f):
+            if name == "Objective":
+                return float(value)
+
+
+# Short horizons of the builders, solved with HiGHS. The demand of PAP
+# starts at hour 168, so its horizon is longer.
+@pytest.mark.parametrize("reduce", [True, False])
+def test_pap_short_horizon(series, reduce):
+    model = build_pap(pap_parameters("FI", "22"), *series("FI", 240))
+    result = solve_model(model, make_backend("highs"), reduce=reduce)
+    assert result.optimal
+    assert result.objective == pytest.approx(8613377.762628, rel=1e-7)
+
+
+@pytest.mark.parametrize("reduce", [True, False])
+def test_base_short_horizon(reduce):
+    model = build_base(base_parameters("FI", "22"), 150)
+    result = solve_model(model, make_backend("highs"), reduce=reduce)
+    assert result.optimal
+    assert result.objective == pytest.approx(21322158.009499, rel=1e-7)
+
+
+@pytest.mark.full_year
+def test_pap_full_year_matches_original(series):
+    model = build_pap(pap_parameters("FI", "22"), *series("FI"))
+    result = solve_model(model, make_backend("highs"))
+    assert result.optimal
+    assert result.objective == pytest.approx(stored_objective("PAP", "FI", "22"), rel=1e-7)
+
+
+@pytest.mark.full_year
+def test_base_full_year_matches_original():
+    model = build_base(base_parameters("FI", "22"), 8784)
+    result = solve_model(model, make_backend("highs"))
+    assert result.optimal
+    assert result.objective == pytest.approx(stored_objective("BASE", "FI", "22"), rel=1e-7)
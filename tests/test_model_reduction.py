@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from parameters import pap_parameters, base_parameters
+from model_builder import build_pap, build_base
+from model_reduction import reduce_model
+from solver_backends import OPTIMAL, INFEASIBLE, make_backend, expand_result, solve_model
+from scenario_runner import ScenarioSolver
+
+
+def models(series):
+    # SE buys from the grid (ElectricityBought)
+    yield build_pap(pap_parameters("FI", "22"), *series("FI", 240))
+    yield build_pap(pap_parameters("SE", "20"), *series("SE", 240))
+    yield build_base(base_parameters("FI", "22"), 150)
+
+
+def solve(model, reduce):
+    solveModel, postsolve = reduce_model(model) if reduce else (model, None)
+    result = make_backend("highs").solve(solveModel)
+    return expand_result(result, model, postsolve) if reduce else result, solveModel
+
+
+def test_reduction_keeps_objective(series):
+    for model in models(series):
+        full, _ = solve(model, reduce=False)
+        reduced, solveModel = solve(model, reduce=True)
+        assert full.optimal and reduced.optimal
+        assert solveModel.numVars < model.numVars
+        assert reduced.objective == pytest.approx(full.objective, rel=1e-8)
+
+
+def test_expanded_solution_is_feasible(series):
+    for model in models(series):
+        result, _ = solve(model, reduce=True)
+        x = result.x
+        assert x.shape == (model.numVars,)
+        tol = 1e-6 * max(1.0, np.abs(x).max())
+        assert np.all(x >= model.lb - tol) and np.all(x <= model.ub + tol)
+        activity = model.A @ x
+        sense = np.asarray(model.sense)
+        assert np.all(activity[sense == "<"] <= model.rhs[sense == "<"] + tol)
+        assert np.all(activity[sense == ">"] >= model.rhs[sense == ">"] - tol)
+        assert np.allclose(activity[sense == "="], model.rhs[sense == "="], atol=tol)
+        assert model.c @ x + model.objConstant == pytest.approx(result.objective, rel=1e-8)
+
+
+def test_infeasible_model_is_reported_by_the_result(series):
+    params = pap_parameters("FI", "22")
+    params["MaxCapacityWind"] = -1
+    model = build_pap(params, *series("FI", 60))
+    for reduce in (True, False):
+        result = solve_model(model, make_backend("highs"), reduce=reduce)
+        assert result.status == INFEASIBLE and result.x is None
+
+
+def test_infeasible_scenario_fails_alone(series):
+    params = pap_parameters("FI", "22")
+    infeasible = dict(params, MaxCapacityWind=-1)
+    models = [build_pap(p, *series("FI", 240)) for p in (params, infeasible, params)]
+    solver = ScenarioSolver(make_backend("highs"), reduce=True)
+    results = solver.solve_all(models)
+    solver.dispose()
+    assert [result.status for result in results] == [OPTIMAL, INFEASIBLE, OPTIMAL]
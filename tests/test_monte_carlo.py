@@ -0,0 +1,30 @@
+import numpy as np
+
+from monte_carlo import bootstrap_indices, sample_series
+
+
+def test_sample_series_is_reproducible(series):
+    original = series("FI")
+    first = sample_series(original, 3, seed=2022)
+    again = sample_series(original, 3, seed=2022)
+    for a, b in zip(first, again):
+        np.testing.assert_array_equal(a, b)
+    other = sample_series(original, 4, seed=2022)
+    assert not np.array_equal(first[0], other[0])
+    assert not np.array_equal(first[0], sample_series(original, 3, seed=2023)[0])
+
+
+def test_sample_series_keeps_hours_together(series):
+    original = series("FI")
+    indices = bootstrap_indices(len(original[0]), np.random.default_rng([2022, 3]))
+    assert indices.shape == (len(original[0]),)
+    assert indices.min() >= 0 and indices.max() < len(original[0])
+    # Hour of day kept, and the three series take the same hours
+    assert np.all(indices % 24 == np.arange(indices.size) % 24)
+    for values, sampled in zip(original, sample_series(original, 3, seed=2022)):
+        np.testing.assert_array_equal(sampled, np.asarray(values, dtype=float)[indices])
+
+
+def test_short_horizon_ends_mid_day():
+    indices = bootstrap_indices(100, np.random.default_rng(0))
+    assert indices.shape == (100,) and indices.max() < 100
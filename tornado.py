@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Tornado sensitivities from the duals of one solve
+#
+# The objective of an LP is a function of its data whose first derivative
+# at the optimum follows from the solution alone (envelope theorem): with
+# duals pi (d objective / d rhs, Gurobi's Pi) and reduced costs r,
+#
+#   d objective / dp = dc/dp . x + dk/dp - pi . (dA/dp x - db/dp) + r . d bound/dp
+#
+# where only the bounds x sits at count. scenario_gradients() gets dc/dp,
+# dA/dp, db/dp and the bounds by building the model once more with every
+# parameter nudged, which is exact because the builders are affine in each
+# parameter, so one solve gives the gradient of every scalar parameter.
+#
+# run_tornado() turns the gradients into first-order objective estimates
+# of the sensitivity scenarios and writes them in the layout of
+# sensitivity_PAP.csv and sensitivity_base.csv. The estimate of a scenario
+# that changes one parameter within the ranging interval of the optimal
+# basis (Gurobi) is exact and flagged Exact; for an objective coefficient
+# the base capacities stay optimal too. Curved responses such as
+# EfficiencyElec +-20% (about 4% off) are what resolve is for: it solves
+# the scenarios that are not exact, warm-started from the base basis.
+# With runLog every country and price appends a record of its phases and
+# solves to the run log, as the jobs of sweep.py do.
+
+import csv
+
+import numpy as np
+
+from input_data import defaultYear
+from parameters import apply_scenario
+from model_reduction import reduce_model, no_reduction
+from solver_backends import make_backend
+from sweep import headers, input_series, scenario_parameters, build_models
+from parametric import model_direction, parameter_range, solve_warm
+from kpis import kpiColumns, run_kpis
+from instrumentation import RunLog, write_record
+import results_db
+
+# Scalar parameters with a tornado bar
+tornadoParameters = {
+    "PAP": ["CapexElec", "OpexElec", "RElec", "EfficiencyElec", "CapexStorage", "WaterCost", "ElecTax", "TransmisFee",
+            "PapPriceWind", "PapPriceSolar", "GridPriceScale"],
+    "BASE": ["CapexElec", "OpexElec", "RElec", "EfficiencyElec", "CapexStorage", "WaterCost", "ElecTax", "TransmisFee",
+             "BasePriceWind", "BasePriceSolar"],
+}
+relativeChange = 0.2  # <parameter>Up and <parameter>Down scenarios
+relativeStep = 1e-4  # Nudge of a parameter for its derivatives of the model data
+
+
+def tornado_scenarios(kind):
+    """Scenario names of a full tornado: Up and Down of every parameter."""
+    return [parameter + suffix for parameter in tornadoParameters[kind] for suffix in ("Down", "Up")]
+
+
+def tornado_parameters(params, scenario, change=relativeChange):
+    """Parameters of scenario: a sensitivity scenario of
+    parameters.apply_scenario(), or <parameter>Up / <parameter>Down for
+    the parameter changed by +-change."""
+    try:
+        return apply_scenario(params, scenario)
+    except ValueError:
+        for suffix, factor in (("Up", 1 + change), ("Down", 1 - change)):
+            name = scenario[:-len(suffix)]
+            if scenario.endswith(suffix) and isinstance(params.get(name), (int, float)):
+                p = dict(params)
+                p[name] = params[name] * factor
+                p["Scenario"] = scenario
+                return p
+        raise
+
+
+def scenario_gradients(kind, series, params, backend, keys, reduce=True, step=relativeStep):
+    """Solve the model of params on backend and differentiate its optimal
+    objective with respect to every parameter of keys.
+
+    Returns (model, result, gradients, directions): the full model, its
+    SolverResult (full solution in x), the derivative of every key (None
+    where the nudged model has another structure) and how the solved model
+    moves with every key (parametric.model_direction).
+    """
+    model = build_models(kind, series, [params])[0]
+    solveModel, postsolve = reduce_model(model) if reduce else no_reduction(model)
+    backend.load(solveModel)
+    result = backend.optimize()
+    gradients = dict.fromkeys(keys)
+    directions = dict.fromkeys(keys)
+    if not result.optimal or result.duals is None:
+        result.x = postsolve.expand(result.x) if result.x is not None else None
+        return model, result, gradients, directions
+
+    y = result.x
+    for key in keys:
+        h = step * abs(params[key]) or step
+        nudged = dict(params)
+        nudged[key] = params[key] + h
+        nudgedModel = build_models(kind, series, [nudged])[0]
+        other, _ = reduce_model(nudgedModel) if reduce else no_reduction(nudgedModel)
+        gradients[key] = _envelope(solveModel, other, y, result.duals, result.reducedCosts, h)
+        directions[key] = model_direction(solveModel, other, h)
+    directions = {key: (direction, parameter_range(backend, solveModel, direction, params[key]))
+                  for key, direction in directions.items()}
+    result.x = postsolve.expand(y)
+    return model, result, gradients, directions
+
+
+def _envelope(model, other, y, duals, reducedCosts, h, tol=1e-7):
+    """Derivative of the optimal objective of model at solution y when the
+    data move from model to other over a parameter step h."""
+    if not model.same_structure(other):
+        return None
+    A, B = model.A.tocsr(), other.A.tocsr()
+    A.sort_indices()
+    B.sort_indices()
+    dA = A.copy()
+    dA.data = B.data - A.data
+    change = (other.c - model.c) @ y + (other.objConstant - model.objConstant)
+    change -= duals @ (dA @ y - (other.rhs - model.rhs))
+    for bound in ("lb", "ub"):
+        old, new = getattr(model, bound), getattr(other, bound)
+        moved = np.flatnonzero((old != new) & np.isfinite(old) & (np.abs(y - old) <= tol * np.maximum(1.0, np.abs(old))))
+        change += reducedCosts[moved] @ (new[moved] - old[moved])
+    return float(change / h)
+
+
+def run_tornado(kind, countries, prices, scenarios, output, backend="gurobi", reduce=True, resolve=False, database=None,
+                runLog=None, **options):
+    """First-order estimates of the scenarios of every country and price
+    from one base solve each, written to output in the sensitivity CSV
+    layout with a Base row first. Estimate is 1 for estimated rows, Exact 1
+    where the objective is exact. Estimated rows have capacities and key
+    figures only where the base solution stays optimal. With resolve the
+    scenarios whose estimate is not exact are solved instead.
+    Instrumentation records go to the JSON lines file runLog if given."""
+    solver = make_backend(backend, progress=bool(runLog), **options)
+    log = RunLog(runLog, "tornado", model=kind, output=output, backend=backend, method=options.get("method"),
+                 reduce=reduce, resolve=resolve)
+    db = results_db.connect(database) if database else None
+    rows = []
+    try:
+        with open(output, mode='w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(headers[kind] + kpiColumns[kind] + ["Estimate", "Exact"])
+            for country in countries:
+                for price in prices:
+                    jobLog = RunLog(None, "tornado job", model=kind, country=country, price=price, scenarios=list(scenarios))
+                    jobRows = _tornado_job(kind, country, price, scenarios, solver, reduce, resolve, jobLog)
+                    if runLog:
+                        write_record(runLog, dict(jobLog.record(), output=output))
+                    with log.phase("collect"):  # CSV rows and results database
+                        writer.writerows(jobRows)
+                        output_file.flush()
+                        rows.extend(jobRows)
+                        if db is not None:
+                            nColumns = len(headers[kind])
+                            for row in jobRows:
+                                values = dict(zip(headers[kind][3:-1], row[3:nColumns - 1]))
+                                info = dict(zip(kpiColumns[kind] + ["Estimate", "Exact"], row[nColumns:]))
+                                results_db.add_run(db, kind, country, price, row[2], values, row[nColumns - 1],
+                                                   defaultYear, source=output, **info)
+    finally:
+        solver.dispose()
+        if db is not None:
+            db.close()
+    log.set(jobs=len(countries) * len(prices), rows=len(rows))
+    log.write()
+    return rows
+
+
+def _tornado_job(kind, country, price, scenarios, solver, reduce, resolve, log):
+    with log.phase("read"):
+        series = input_series(kind, country)
+    gridPrice = series[2] if kind == "PAP" else None
+    params = scenario_parameters(kind, country, price, None)
+    cases = {scenario: tornado_parameters(params, scenario) for scenario in scenarios}
+    keys = sorted({key for p in cases.values() for key in _changed(params, p)})
+
+    with log.phase("gradients"):  # base solve, nudged models and ranging
+        model, result, gradients, directions = scenario_gradients(kind, series, params, solver, keys, reduce)
+    log.model("built", model)
+    log.solver(result, scenario="Base")
+    capacities = headers[kind][3:-1]
+
+    def row(scenario, values, objective, kpis, estimate, exact):
+        if values is None:
+            values = dict.fromkeys(capacities, np.nan)
+        if kpis is None:
+            kpis = dict.fromkeys(kpiColumns[kind], np.nan)
+        return ([country, price, scenario] + [values[name] for name in capacities] + [objective]
+                + [kpis[name] for name in kpiColumns[kind]] + [estimate, exact])
+
+    if result.x is None:
+        print("%s %s %s: base not solved (%s)" % (kind, country, price, result.status))
+        return [row(scenario, None, np.nan, None, 1, 0) for scenario in ["Base"] + list(scenarios)]
+    base = model.split(result.x)
+    jobRows = [row("Base", base, result.objective, run_kpis(kind, params, base, result.objective, gridPrice), 0, 1)]
+    start = solver.start()
+
+    for scenario, p in cases.items():
+        changed = _changed(params, p)
+        if any(gradients[key] is None for key in changed):
+            objective = np.nan
+        else:
+            objective = result.objective + sum(gradients[key] * (p[key] - params[key]) for key in changed)
+        # One parameter inside the ranging interval of the basis: the estimate
+        # is exact, and so is the base solution for an objective coefficient
+        inside = not changed
+        sameSolution = not changed
+        if len(changed) == 1:
+            direction, interval = directions[changed[0]]
+            inside = interval is not None and interval[0] <= p[changed[0]] <= interval[1]
+            sameSolution = inside and direction[0] == "c"
+        if sameSolution:
+            jobRows.append(row(scenario, base, objective, run_kpis(kind, p, base, objective, gridPrice), 1, 1))
+        elif inside:
+            jobRows.append(row(scenario, None, objective, None, 1, 1))
+        elif resolve:
+            with log.phase("resolve"):
+                scenarioModel = build_models(kind, series, [p])[0]
+                solveModel, postsolve = reduce_model(scenarioModel) if reduce else no_reduction(scenarioModel)
+                solved = solve_warm(solver, solveModel, start, None)
+            log.solver(solved, scenario=scenario)
+            if solved.x is None:
+                jobRows.append(row(scenario, None, np.nan, None, 0, 0))
+                continue
+            values = scenarioModel.split(postsolve.expand(solved.x))
+            jobRows.append(row(scenario, values, solved.objective, run_kpis(kind, p, values, solved.objective, gridPrice), 0, 1))
+            print("%s %s %s %s: estimate %.6g, solved %.6g" % (kind, country, price, scenario, objective, solved.objective))
+        else:
+            jobRows.append(row(scenario, None, objective, None, 1, 0))
+    return jobRows
+
+
+def _changed(params, other):
+    """Scalar parameters that differ between params and other."""
+    return [key for key, value in other.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value != params.get(key)]